@@ -0,0 +1,61 @@
+"""Микробенчмарк диспетчеризации callback-кнопок.
+
+Сравнивает цепочку фильтров (как у @bot.callback_query_handler(func=...))
+с таблицей Router при росте числа действий меню.
+
+    python benchmarks/dispatch_benchmark.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from router import Router
+
+
+def handler(call, *args):
+    return args
+
+
+def build(actions: int):
+    chain = []
+    router = Router()
+    for i in range(actions):
+        key = f"menu_action{i}"
+        chain.append((lambda data, key=key: data == key, handler))
+        router.route(key)(handler)
+    chain.append((lambda data: data.startswith("switch_trip_"), handler))
+    router.route("switch_trip")(handler)
+    return chain, router
+
+
+def dispatch_chain(chain, data):
+    for check, func in chain:
+        if check(data):
+            return func(None)
+
+
+def dispatch_router(router, data):
+    action, args = router.parse_callback(data)
+    return router.get(action)(None, *args)
+
+
+def main():
+    number = 20000
+    print(f"{'действий':>9} | {'цепочка, нс':>12} | {'Router, нс':>11}")
+    for actions in (10, 100, 1000):
+        chain, router = build(actions)
+        # Худший случай для цепочки — последнее действие меню и действие с аргументом
+        # (switch_trip проверяется после всех действий меню)
+        samples = [f"menu_action{actions - 1}", "switch_trip_42"]
+        chain_time = min(timeit.repeat(
+            lambda: [dispatch_chain(chain, data) for data in samples], number=number, repeat=3))
+        router_time = min(timeit.repeat(
+            lambda: [dispatch_router(router, data) for data in samples], number=number, repeat=3))
+        per_call = 1e9 / (number * len(samples))
+        print(f"{actions:>9} | {chain_time * per_call:>12.0f} | {router_time * per_call:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
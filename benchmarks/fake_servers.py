@@ -0,0 +1,155 @@
+"""Локальные заменители Telegram Bot API и exchangerate.host для нагрузочных тестов.
+
+Оба сервера отвечают в формате настоящих API, добавляют задержку
+(latency ± jitter) и с заданной вероятностью возвращают ошибку:
+Telegram — 429 с retry_after, API курсов — 500.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+CURRENCIES = {
+    "USD": "United States Dollar", "EUR": "Euro", "GBP": "British Pound Sterling",
+    "RUB": "Russian Ruble", "TRY": "Turkish Lira", "CNY": "Chinese Yuan",
+    "JPY": "Japanese Yen", "KRW": "South Korean Won", "THB": "Thai Baht",
+    "KZT": "Kazakhstani Tenge", "GEL": "Georgian Lari", "AED": "UAE Dirham",
+}
+
+
+class FakeServer:
+    """Общая часть: задержка, ошибки и счётчики запросов"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self.runner = None
+        self.port = None
+
+    async def delay(self):
+        latency = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    def fail(self) -> bool:
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить сервер; возвращает базовый URL"""
+        self.runner = web.AppRunner(self.build_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+class FakeTelegramServer(FakeServer):
+    """Bot API: sendMessage, editMessageText, answerCallbackQuery, sendDocument и др."""
+
+    def __init__(self, *args, retry_after: int = 1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+        self.message_ids = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = dict(await request.post())
+        await self.delay()
+
+        if self.fail():
+            self.errors[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        if method in ("answerCallbackQuery", "setWebhook", "deleteWebhook"):
+            return web.json_response({"ok": True, "result": True})
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"
+            }})
+        return web.json_response({"ok": True, "result": self.message(params)})
+
+    def message(self, params: dict) -> dict:
+        self.message_ids += 1
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": int(params.get("message_id") or self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+
+class FakeRatesServer(FakeServer):
+    """exchangerate.host: /live, /list и /convert с котировками к USD"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Стабильные котировки: курс зависит только от кода валюты
+        self.quotes = {code: 1.0 if code == "USD" else 0.5 + (sum(map(ord, code)) % 97) for code in CURRENCIES}
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/live", self.live)
+        app.router.add_get("/list", self.list)
+        app.router.add_get("/convert", self.convert)
+        return app
+
+    async def respond(self, endpoint: str, payload) -> web.Response:
+        self.calls[endpoint] += 1
+        await self.delay()
+        if self.fail():
+            self.errors[endpoint] += 1
+            return web.Response(status=500, text="upstream error")
+        return web.Response(text=json.dumps(payload), content_type="application/json")
+
+    async def live(self, request: web.Request) -> web.Response:
+        source = request.query.get("source", "USD")
+        codes = [code for code in request.query.get("currencies", "").split(",") if code in self.quotes]
+        unit = self.quotes.get(source, 1.0)
+        return await self.respond("live", {
+            "success": True,
+            "source": source,
+            "timestamp": int(time.time()),
+            "quotes": {f"{source}{code}": self.quotes[code] / unit for code in codes},
+        })
+
+    async def list(self, request: web.Request) -> web.Response:
+        return await self.respond("list", {"success": True, "currencies": CURRENCIES})
+
+    async def convert(self, request: web.Request) -> web.Response:
+        source = request.query.get("from", "USD")
+        target = request.query.get("to", "USD")
+        amount = float(request.query.get("amount", 1))
+        quote = self.quotes.get(target, 1.0) / self.quotes.get(source, 1.0)
+        return await self.respond("convert", {
+            "success": True,
+            "query": {"from": source, "to": target, "amount": amount},
+            "info": {"timestamp": int(time.time()), "quote": quote},
+            "result": amount * quote,
+        })
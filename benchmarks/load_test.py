@@ -0,0 +1,173 @@
+"""Нагрузочный тест бота на локальных заменителях Telegram и API курсов.
+
+Синтетические пользователи одновременно проходят полный сценарий:
+/newtrip → страна → валюта → подтверждение курса → бюджет →
+несколько расходов с подтверждением → /balance. Обновления подаются
+прямо в диспетчер бота, а ответы уходят на FakeTelegramServer, поэтому
+измеряется весь путь: обработчики, DatabaseManager, current_api и отправка.
+
+    python benchmarks/load_test.py --users 100 --expenses 5
+    python benchmarks/load_test.py --tg-latency-ms 50 --tg-error-rate 0.02 --rate-error-rate 0.1
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_servers import FakeRatesServer, FakeTelegramServer
+
+TOKEN = "123456:BENCH"
+
+
+def percentile(values, q: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class LoadTest:
+    """Подаёт синтетические обновления в бота и замеряет время их обработки"""
+
+    def __init__(self, bot_module, users: int, expenses: int):
+        self.bot = bot_module
+        self.users = users
+        self.expenses = expenses
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.latencies = defaultdict(list)
+        self.failed = 0
+
+    def user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def message(self, user_id: int, text: str) -> dict:
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self.user(user_id),
+            "text": text,
+        }
+
+    async def send(self, kind: str, update: dict):
+        from telebot import types
+
+        update["update_id"] = next(self.update_ids)
+        started = time.perf_counter()
+        try:
+            await self.bot.bot.process_new_updates([types.Update.de_json(update)])
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ {kind}: {e}")
+        self.latencies[kind].append(time.perf_counter() - started)
+
+    async def text(self, kind: str, user_id: int, text: str):
+        message = self.message(user_id, text)
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        await self.send(kind, {"message": message})
+
+    async def callback(self, kind: str, user_id: int, data: str):
+        await self.send(kind, {"callback_query": {
+            "id": str(next(self.update_ids)),
+            "from": self.user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": self.message(user_id, "⏳"),
+        }})
+
+    async def run_user(self, user_id: int):
+        await self.text("/newtrip", user_id, "/newtrip")
+        await self.text("страна отправления", user_id, "Россия")
+        await self.text("страна назначения", user_id, "Турция")
+        await self.callback("confirm_rate", user_id, "confirm_rate_yes")
+        await self.text("бюджет", user_id, "10000")
+        for _ in range(self.expenses):
+            await self.text("расход", user_id, "250")
+            await self.callback("confirm_expense", user_id, "confirm_expense_yes")
+        await self.text("/balance", user_id, "/balance")
+
+    async def run(self) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_user(1000000 + i) for i in range(self.users)))
+        return time.perf_counter() - started
+
+
+def print_report(test: LoadTest, elapsed: float, telegram: FakeTelegramServer, rates: FakeRatesServer):
+    all_latencies = [value for values in test.latencies.values() for value in values]
+    print(f"\n{'обновление':<22} {'шт.':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for kind, values in list(test.latencies.items()) + [("ВСЕГО", all_latencies)]:
+        print(f"{kind:<22} {len(values):>7} "
+              f"{percentile(values, 50) * 1000:>9.2f} "
+              f"{percentile(values, 95) * 1000:>9.2f} "
+              f"{percentile(values, 99) * 1000:>9.2f}")
+
+    print(f"\nПользователей: {test.users}, расходов на пользователя: {test.expenses}")
+    print(f"Время: {elapsed:.2f} с, обновлений в секунду: {len(all_latencies) / elapsed:.1f}")
+    print(f"Ошибок обработки: {test.failed}")
+    print(f"Telegram API: {dict(telegram.calls)}, ошибок 429: {sum(telegram.errors.values())}, "
+          f"повторов ботом: {test.bot.bot.retries_429}")
+    print(f"API курсов: {dict(rates.calls)}, ошибок 500: {sum(rates.errors.values())}")
+
+
+async def main(args):
+    telegram = FakeTelegramServer(args.tg_latency_ms, args.tg_jitter_ms, args.tg_error_rate)
+    rates = FakeRatesServer(args.rate_latency_ms, args.rate_jitter_ms, args.rate_error_rate)
+    telegram_url = await telegram.start()
+    rates_url = await rates.start()
+
+    # Бот читает настройки при импорте: окружение готовится заранее
+    workdir = tempfile.mkdtemp(prefix="travel_wallet_bench_")
+    os.chdir(workdir)
+    os.environ["TELEGRAM_BOT_TOKEN"] = TOKEN
+    if args.batch_writes:
+        os.environ["DB_BATCH_WRITES"] = "1"
+    if not args.telegram_limits:
+        # Без лимитов Telegram измеряется сам бот, а не ожидание в корзинах токенов
+        os.environ.setdefault("SEND_GLOBAL_RATE", "1000000")
+        os.environ.setdefault("SEND_CHAT_RATE", "1000000")
+        os.environ.setdefault("SEND_CHAT_BURST", "1000000")
+
+    import telebot.asyncio_helper
+    import current_api
+
+    telebot.asyncio_helper.API_URL = telegram_url + "/bot{0}/{1}"
+    current_api._client.base_url = rates_url
+    current_api._async_client.base_url = rates_url
+
+    import bot
+
+    print(f"📁 База данных: {os.path.join(workdir, bot.database.db_name)}")
+    await bot.startup()
+    test = LoadTest(bot, args.users, args.expenses)
+    try:
+        elapsed = await test.run()
+    finally:
+        await bot.shutdown()
+        bot.database.close()
+        await telegram.stop()
+        await rates.stop()
+    print_report(test, elapsed, telegram, rates)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальных заменителях API")
+    parser.add_argument("--users", type=int, default=50, help="число одновременных пользователей")
+    parser.add_argument("--expenses", type=int, default=5, help="расходов на пользователя")
+    parser.add_argument("--tg-latency-ms", type=float, default=0, help="задержка Telegram API")
+    parser.add_argument("--tg-jitter-ms", type=float, default=0, help="разброс задержки Telegram API")
+    parser.add_argument("--tg-error-rate", type=float, default=0, help="доля ответов 429 от Telegram API")
+    parser.add_argument("--rate-latency-ms", type=float, default=0, help="задержка API курсов")
+    parser.add_argument("--rate-jitter-ms", type=float, default=0, help="разброс задержки API курсов")
+    parser.add_argument("--rate-error-rate", type=float, default=0, help="доля ответов 500 от API курсов")
+    parser.add_argument("--batch-writes", action="store_true", help="включить групповую запись расходов")
+    parser.add_argument("--telegram-limits", action="store_true",
+                        help="соблюдать лимиты отправки Telegram (SEND_* из окружения)")
+    asyncio.run(main(parser.parse_args()))
@@ -1,24 +1,60 @@
-import telebot
+import asyncio
+import functools
 from telebot import types
 import os
+import tempfile
+import time
 from dotenv import load_dotenv
-from database import DatabaseManager
-from current_api import convert_currency, get_all_supported_currencies
+from database import DatabaseManager, AsyncDatabaseManager
+from state_store import create_state_store
+from router import Router
+from currency_index import CurrencyIndex
+from current_api import async_get_all_supported_currencies, close_async_client, get_cache_stats, RateTable
+from rate_snapshot import load_snapshot, save_snapshot, snapshot_age
+from rate_refresher import RateRefresher, SnapshotWatcher
+from export import EXPORT_FORMATS, export_trip
+from trip_stats import MOVING_AVERAGE_WINDOWS, compute_trip_stats
+from outbound import ThrottledTeleBot
+from metrics import HANDLER_LATENCY, METRICS_PORT, counter, gauge, start_metrics_server
 import re
 
 load_dotenv()
 
 # Инициализация бота и базы данных
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-bot = telebot.TeleBot(BOT_TOKEN)
-db = DatabaseManager()
+# Отправка сообщений с лимитами Telegram и объединением заглушек «⏳»
+bot = ThrottledTeleBot(BOT_TOKEN)
+database = DatabaseManager()
+if os.getenv("DB_BATCH_WRITES") == "1":
+    # Групповая запись расходов для пиковой нагрузки
+    database.enable_batch_writes(
+        max_batch=int(os.getenv("DB_BATCH_SIZE", 500)),
+        max_delay_ms=float(os.getenv("DB_BATCH_DELAY_MS", 20))
+    )
+db = AsyncDatabaseManager(database)
+
+# Таблицы диспетчеризации: callback-кнопки по действию и шаги диалога по состоянию
+callbacks = Router()
+states = Router()
 
-# Словарь для хранения временных данных пользователей
-user_states = {}
+# Хранилище временных данных пользователей (состояния диалогов)
+user_states = create_state_store(db)
 
 # Кэш для списка валют
 available_currencies = {}
 
+# Локальная таблица курсов: конвертация расходов без запросов к API
+rate_table = RateTable()
+
+# Через сколько секунд курс в таблице считается устаревшим
+RATE_MAX_AGE = int(os.getenv("RATE_MAX_AGE", 3600))
+
+# Фоновые задачи (обновление справочников и курсов)
+background_tasks = set()
+
+# HTTP-сервер эндпоинта /metrics
+metrics_runner = None
+
 # Популярные страны/регионы с их валютами (для быстрого выбора)
 POPULAR_COUNTRIES = {
     'Россия': 'RUB',
@@ -75,19 +111,39 @@ POPULAR_COUNTRIES = {
 }
 
 
-def load_available_currencies():
+# Индекс для поиска валюты по вводу пользователя (перестраивается при загрузке валют)
+currency_index = CurrencyIndex(POPULAR_COUNTRIES)
+
+async def load_available_currencies():
     """Загрузить список доступных валют из API"""
     global available_currencies
     try:
-        result = get_all_supported_currencies()
+        result = await async_get_all_supported_currencies()
         if result.get('success'):
             available_currencies = result.get('currencies', {})
+            build_currency_index()
             return True
     except Exception as e:
         print(f"Ошибка при загрузке валют: {e}")
     return False
 
 
+def build_currency_index():
+    """Перестроить индекс поиска валют по текущему списку валют"""
+    global currency_index
+    currency_index = CurrencyIndex(POPULAR_COUNTRIES, available_currencies)
+
+
+def format_suggestions(input_text: str) -> str:
+    """Подсказки для ввода с опечаткой"""
+    suggestions = currency_index.suggest(input_text)
+    if not suggestions:
+        return ""
+    return "Возможно, вы имели в виду:\n" + "".join(
+        f"• {name} ({code})\n" for code, name in suggestions
+    ) + "\n"
+
+
 def get_currency_name(code: str) -> str:
     """Получить название валюты по коду"""
     if code in available_currencies:
@@ -95,8 +151,9 @@ def get_currency_name(code: str) -> str:
     return code
 
 
-def get_main_menu_keyboard():
-    """Создать главное меню с inline-кнопками"""
+@functools.lru_cache(maxsize=None)
+def get_main_menu_keyboard() -> str:
+    """Главное меню с inline-кнопками (собирается один раз, отдаётся готовым JSON)"""
     keyboard = types.InlineKeyboardMarkup(row_width=2)
     keyboard.add(
         types.InlineKeyboardButton("✈️ Создать путешествие", callback_data="menu_new_trip"),
@@ -106,7 +163,68 @@ def get_main_menu_keyboard():
         types.InlineKeyboardButton("💱 Изменить курс", callback_data="menu_change_rate"),
         types.InlineKeyboardButton("ℹ️ Помощь", callback_data="menu_help")
     )
-    return keyboard
+    return keyboard.to_json()
+
+
+@functools.lru_cache(maxsize=None)
+def get_back_keyboard() -> str:
+    """Клавиатура с единственной кнопкой «Назад» в главное меню"""
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu"))
+    return keyboard.to_json()
+
+
+@functools.lru_cache(maxsize=256)
+def get_popular_list(exclude: str = None) -> str:
+    """Список популярных направлений, без валюты exclude (варианты кешируются)"""
+    return "\n".join(
+        f"• {country} ({currency})"
+        for country, currency in sorted(POPULAR_COUNTRIES.items())
+        if currency != exclude
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_new_trip_text() -> str:
+    """Текст первого шага создания путешествия"""
+    return (
+        "✈️ Создание нового путешествия\n\n"
+        "Шаг 1/5: Выберите валюту отправления\n\n"
+        "Вы можете:\n"
+        "1️⃣ Написать название страны из списка ниже\n"
+        "2️⃣ Написать код валюты напрямую (например: RUB, USD, EUR)\n\n"
+        "📍 Популярные направления:\n" + get_popular_list() + "\n\n"
+        "💡 Поддерживаются все мировые валюты!"
+    )
+
+
+@functools.lru_cache(maxsize=4)
+def get_help_text(currency_count) -> str:
+    """Текст справки (меняется только вместе с числом валют)"""
+    return (
+        "ℹ️ Справка по использованию бота\n\n"
+        "🔹 Создание путешествия:\n"
+        "Нажмите 'Создать путешествие' и следуйте инструкциям. "
+        "Вы можете написать название страны (Россия, США) или код валюты (RUB, USD). "
+        f"Поддерживаются {currency_count} валют из всех стран мира! "
+        "Начальная сумма автоматически конвертируется по текущему курсу.\n\n"
+        "🔹 Учёт расходов:\n"
+        "Просто отправьте число — бот воспримет его как расход "
+        "в валюте страны пребывания и предложит подтвердить.\n\n"
+        "🔹 Переключение путешествий:\n"
+        "Через меню 'Мои путешествия' вы можете переключаться между "
+        "разными поездками.\n\n"
+        "🔹 Команды:\n"
+        "/start — запустить бота\n"
+        "/menu — показать главное меню\n"
+        "/newtrip — создать новое путешествие\n"
+        "/balance — показать баланс\n"
+        "/history — история расходов\n"
+        "/stats — темп расходов и прогноз остатка\n"
+        "/export — выгрузить все расходы в CSV\n"
+        "/setrate — изменить курс обмена\n"
+        "/switch — переключить путешествие"
+    )
 
 
 def format_number(num: float) -> str:
@@ -114,18 +232,84 @@ def format_number(num: float) -> str:
     return f"{num:,.2f}".replace(",", " ")
 
 
+# Размер страниц списка путешествий и истории расходов
+TRIPS_PAGE_SIZE = 10
+HISTORY_PAGE_SIZE = 15
+
+TRIPS_TEXT = "🗂 Ваши путешествия:\n\nНажмите на путешествие, чтобы сделать его активным:"
+
+
+def add_page_buttons(keyboard, page: dict, prefix: str, id_field: str):
+    """Кнопки листания: курсор — id крайней записи страницы"""
+    items = page['items']
+    if not items:
+        return
+    buttons = []
+    if page['has_prev']:
+        buttons.append(types.InlineKeyboardButton(
+            "⬅️ Предыдущие", callback_data=f"{prefix}_prev_{items[0][id_field]}"
+        ))
+    if page['has_next']:
+        buttons.append(types.InlineKeyboardButton(
+            "Следующие ➡️", callback_data=f"{prefix}_next_{items[-1][id_field]}"
+        ))
+    if buttons:
+        keyboard.row(*buttons)
+
+
+def get_trips_keyboard(page: dict):
+    """Кнопки путешествий страницы, листание и возврат в меню"""
+    keyboard = types.InlineKeyboardMarkup()
+    for trip in page['items']:
+        status = "✅" if trip['is_active'] else "⭕️"
+        button_text = f"{status} {trip['trip_name']} ({trip['currency_from']} → {trip['currency_to']})"
+        keyboard.add(
+            types.InlineKeyboardButton(
+                button_text,
+                callback_data=f"switch_trip_{trip['trip_id']}"
+            )
+        )
+    add_page_buttons(keyboard, page, "trips", 'trip_id')
+    keyboard.add(types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu"))
+    return keyboard
+
+
+def format_history(trip: dict, page: dict) -> str:
+    """Текст страницы истории расходов"""
+    if not page['items']:
+        return f"📊 История расходов: {trip['trip_name']}\n\nПока нет записей о расходах."
+    text = f"📊 История расходов: {trip['trip_name']}\n\n"
+    for exp in page['items']:
+        date_str = exp['created_at'].split()[0] if ' ' in exp['created_at'] else exp['created_at']
+        text += (
+            f"📅 {date_str}\n"
+            f"  💸 {format_number(exp['amount_to'])} {trip['currency_to']} "
+            f"= {format_number(exp['amount_from'])} {trip['currency_from']}\n\n"
+        )
+    return text
+
+
+def get_history_keyboard(page: dict):
+    """Листание истории и возврат в меню"""
+    keyboard = types.InlineKeyboardMarkup()
+    add_page_buttons(keyboard, page, "history", 'expense_id')
+    keyboard.add(types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu"))
+    return keyboard
+
+
 @bot.message_handler(commands=['start'])
-def start_command(message):
+@HANDLER_LATENCY.timed('command', 'start')
+async def start_command(message):
     """Обработчик команды /start"""
     user_id = message.from_user.id
     username = message.from_user.username
     
     # Добавить пользователя в базу данных
-    db.add_user(user_id, username)
+    await db.add_user(user_id, username)
     
     # Загрузить список валют из API, если ещё не загружен
     if not available_currencies:
-        load_available_currencies()
+        await load_available_currencies()
     
     welcome_text = (
         f"👋 Привет, {message.from_user.first_name}!\n\n"
@@ -139,51 +323,58 @@ def start_command(message):
         "Выбери действие из меню ниже 👇"
     )
     
-    bot.send_message(message.chat.id, welcome_text, reply_markup=get_main_menu_keyboard())
+    await bot.send_message(message.chat.id, welcome_text, reply_markup=get_main_menu_keyboard())
 
 
 @bot.message_handler(commands=['menu'])
-def menu_command(message):
+@HANDLER_LATENCY.timed('command', 'menu')
+async def menu_command(message):
     """Показать главное меню"""
-    bot.send_message(
+    await bot.send_message(
         message.chat.id,
         "📱 Главное меню:",
         reply_markup=get_main_menu_keyboard()
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "menu_new_trip")
-def callback_new_trip(call):
+@callbacks.route("menu_new_trip")
+async def callback_new_trip(call):
     """Начать создание нового путешествия"""
     user_id = call.from_user.id
-    user_states[user_id] = {'state': 'waiting_currency_from'}
+    await user_states.set(user_id, {'state': 'waiting_currency_from'})
     
-    # Показать популярные страны
-    popular_list = "\n".join([f"• {country} ({currency})" for country, currency in sorted(POPULAR_COUNTRIES.items())])
-    
-    bot.edit_message_text(
+    await bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
-        text=(
-            "✈️ Создание нового путешествия\n\n"
-            "Шаг 1/5: Выберите валюту отправления\n\n"
-            "Вы можете:\n"
-            "1️⃣ Написать название страны из списка ниже\n"
-            "2️⃣ Написать код валюты напрямую (например: RUB, USD, EUR)\n\n"
-            "📍 Популярные направления:\n" + popular_list + "\n\n"
-            "💡 Поддерживаются все мировые валюты!"
-        )
+        text=get_new_trip_text()
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "menu_my_trips")
-def callback_my_trips(call):
-    """Показать все путешествия пользователя"""
+@callbacks.route("menu_my_trips")
+async def callback_my_trips(call):
+    """Показать путешествия пользователя (первая страница)"""
+    await edit_trips_page(call)
+
+
+@callbacks.route("trips_next")
+async def callback_trips_next(call, trip_id):
+    """Следующая страница путешествий"""
+    await edit_trips_page(call, before=int(trip_id))
+
+
+@callbacks.route("trips_prev")
+async def callback_trips_prev(call, trip_id):
+    """Предыдущая страница путешествий"""
+    await edit_trips_page(call, after=int(trip_id))
+
+
+async def edit_trips_page(call, before: int = None, after: int = None):
+    """Показать страницу путешествий в том же сообщении"""
     user_id = call.from_user.id
-    trips = db.get_all_trips(user_id)
+    page = await db.get_trips_page(user_id, TRIPS_PAGE_SIZE, before=before, after=after)
     
-    if not trips:
-        bot.edit_message_text(
+    if not page['items'] and before is None and after is None:
+        await bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text="У вас пока нет путешествий. Создайте первое! 🌍",
@@ -191,35 +382,23 @@ def callback_my_trips(call):
         )
         return
     
-    keyboard = types.InlineKeyboardMarkup()
-    for trip in trips:
-        status = "✅" if trip['is_active'] else "⭕️"
-        button_text = f"{status} {trip['trip_name']} ({trip['currency_from']} → {trip['currency_to']})"
-        keyboard.add(
-            types.InlineKeyboardButton(
-                button_text,
-                callback_data=f"switch_trip_{trip['trip_id']}"
-            )
-        )
-    keyboard.add(types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu"))
-    
-    bot.edit_message_text(
+    await bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
-        text="🗂 Ваши путешествия:\n\nНажмите на путешествие, чтобы сделать его активным:",
-        reply_markup=keyboard
+        text=TRIPS_TEXT,
+        reply_markup=get_trips_keyboard(page)
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("switch_trip_"))
-def callback_switch_trip(call):
+@callbacks.route("switch_trip")
+async def callback_switch_trip(call, trip_id):
     """Переключить активное путешествие"""
     user_id = call.from_user.id
-    trip_id = int(call.data.split("_")[2])
+    trip_id = int(trip_id)
     
-    if db.switch_active_trip(user_id, trip_id):
-        trip = db.get_active_trip(user_id)
-        bot.answer_callback_query(call.id, "✅ Путешествие активировано!")
+    if await db.switch_active_trip(user_id, trip_id):
+        trip = await db.get_active_trip(user_id)
+        await bot.answer_callback_query(call.id, "✅ Путешествие активировано!")
         
         text = (
             f"✅ Активировано путешествие: {trip['trip_name']}\n\n"
@@ -229,24 +408,24 @@ def callback_switch_trip(call):
             f"= {format_number(trip['balance_from'])} {trip['currency_from']}"
         )
         
-        bot.edit_message_text(
+        await bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text=text,
             reply_markup=get_main_menu_keyboard()
         )
     else:
-        bot.answer_callback_query(call.id, "❌ Ошибка при переключении")
+        await bot.answer_callback_query(call.id, "❌ Ошибка при переключении")
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "menu_balance")
-def callback_balance(call):
+@callbacks.route("menu_balance")
+async def callback_balance(call):
     """Показать баланс активного путешествия"""
     user_id = call.from_user.id
-    trip = db.get_active_trip(user_id)
+    trip, stats = await db.get_active_trip_with_stats(user_id)
     
     if not trip:
-        bot.edit_message_text(
+        await bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text="У вас нет активного путешествия. Создайте новое! 🌍",
@@ -254,8 +433,6 @@ def callback_balance(call):
         )
         return
     
-    stats = db.get_trip_statistics(trip['trip_id'])
-    
     text = (
         f"💰 Баланс путешествия: {trip['trip_name']}\n\n"
         f"📍 Маршрут: {trip['country_from']} → {trip['country_to']}\n"
@@ -269,25 +446,39 @@ def callback_balance(call):
         f"  • Количество расходов: {stats['total_expenses']}"
     )
     
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu"))
-    
-    bot.edit_message_text(
+    await bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
         text=text,
-        reply_markup=keyboard
+        reply_markup=get_back_keyboard()
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "menu_history")
-def callback_history(call):
-    """Показать историю расходов"""
+@callbacks.route("menu_history")
+async def callback_history(call):
+    """Показать историю расходов (первая страница)"""
+    await edit_history_page(call)
+
+
+@callbacks.route("history_next")
+async def callback_history_next(call, expense_id):
+    """Более старые расходы"""
+    await edit_history_page(call, before=int(expense_id))
+
+
+@callbacks.route("history_prev")
+async def callback_history_prev(call, expense_id):
+    """Более новые расходы"""
+    await edit_history_page(call, after=int(expense_id))
+
+
+async def edit_history_page(call, before: int = None, after: int = None):
+    """Показать страницу истории расходов в том же сообщении"""
     user_id = call.from_user.id
-    trip = db.get_active_trip(user_id)
+    trip = await db.get_active_trip(user_id)
     
     if not trip:
-        bot.edit_message_text(
+        await bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text="У вас нет активного путешествия.",
@@ -295,39 +486,24 @@ def callback_history(call):
         )
         return
     
-    expenses = db.get_trip_expenses(trip['trip_id'], limit=15)
+    page = await db.get_expenses_page(trip['trip_id'], HISTORY_PAGE_SIZE, before=before, after=after)
     
-    if not expenses:
-        text = f"📊 История расходов: {trip['trip_name']}\n\nПока нет записей о расходах."
-    else:
-        text = f"📊 История расходов: {trip['trip_name']}\n\n"
-        for exp in expenses:
-            date_str = exp['created_at'].split()[0] if ' ' in exp['created_at'] else exp['created_at']
-            text += (
-                f"📅 {date_str}\n"
-                f"  💸 {format_number(exp['amount_to'])} {trip['currency_to']} "
-                f"= {format_number(exp['amount_from'])} {trip['currency_from']}\n\n"
-            )
-    
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu"))
-    
-    bot.edit_message_text(
+    await bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
-        text=text,
-        reply_markup=keyboard
+        text=format_history(trip, page),
+        reply_markup=get_history_keyboard(page)
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "menu_change_rate")
-def callback_change_rate(call):
+@callbacks.route("menu_change_rate")
+async def callback_change_rate(call):
     """Изменить курс обмена"""
     user_id = call.from_user.id
-    trip = db.get_active_trip(user_id)
+    trip = await db.get_active_trip(user_id)
     
     if not trip:
-        bot.edit_message_text(
+        await bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text="У вас нет активного путешествия.",
@@ -335,11 +511,11 @@ def callback_change_rate(call):
         )
         return
     
-    user_states[user_id] = {
+    await user_states.set(user_id, {
         'state': 'waiting_new_rate',
         'trip_id': trip['trip_id'],
         'message_id': call.message.message_id
-    }
+    })
     
     text = (
         f"💱 Изменение курса для путешествия: {trip['trip_name']}\n\n"
@@ -347,55 +523,30 @@ def callback_change_rate(call):
         f"Введите новый курс обмена (например, {trip['exchange_rate']:.4f}):"
     )
     
-    bot.edit_message_text(
+    await bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
         text=text
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "menu_help")
-def callback_help(call):
+@callbacks.route("menu_help")
+async def callback_help(call):
     """Показать справку"""
     currency_count = len(available_currencies) if available_currencies else "150+"
-    help_text = (
-        "ℹ️ Справка по использованию бота\n\n"
-        "🔹 Создание путешествия:\n"
-        "Нажмите 'Создать путешествие' и следуйте инструкциям. "
-        "Вы можете написать название страны (Россия, США) или код валюты (RUB, USD). "
-        f"Поддерживаются {currency_count} валют из всех стран мира! "
-        "Начальная сумма автоматически конвертируется по текущему курсу.\n\n"
-        "🔹 Учёт расходов:\n"
-        "Просто отправьте число — бот воспримет его как расход "
-        "в валюте страны пребывания и предложит подтвердить.\n\n"
-        "🔹 Переключение путешествий:\n"
-        "Через меню 'Мои путешествия' вы можете переключаться между "
-        "разными поездками.\n\n"
-        "🔹 Команды:\n"
-        "/start — запустить бота\n"
-        "/menu — показать главное меню\n"
-        "/newtrip — создать новое путешествие\n"
-        "/balance — показать баланс\n"
-        "/history — история расходов\n"
-        "/setrate — изменить курс обмена\n"
-        "/switch — переключить путешествие"
-    )
     
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu"))
-    
-    bot.edit_message_text(
+    await bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
-        text=help_text,
-        reply_markup=keyboard
+        text=get_help_text(currency_count),
+        reply_markup=get_back_keyboard()
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "back_to_menu")
-def callback_back_to_menu(call):
+@callbacks.route("back_to_menu")
+async def callback_back_to_menu(call):
     """Вернуться в главное меню"""
-    bot.edit_message_text(
+    await bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
         text="📱 Главное меню:",
@@ -403,27 +554,24 @@ def callback_back_to_menu(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("confirm_expense_"))
-def callback_confirm_expense(call):
-    """Подтверждение добавления расхода"""
+@callbacks.route("confirm_expense")
+async def callback_confirm_expense(call, action):
+    """Подтверждение добавления расхода (action: yes или no)"""
     user_id = call.from_user.id
-    action = call.data.split("_")[2]  # yes или no
+    user_state = await user_states.get(user_id)
     
     if action == "yes":
-        if user_id in user_states and 'pending_expense' in user_states[user_id]:
-            expense_data = user_states[user_id]['pending_expense']
-            trip = db.get_active_trip(user_id)
+        if user_state and 'pending_expense' in user_state:
+            expense_data = user_state['pending_expense']
+            
+            # Записать расход и получить обновлённый баланс одной транзакцией
+            trip = await db.record_expense(
+                user_id,
+                expense_data['amount_to'],
+                expense_data['amount_from']
+            )
             
             if trip:
-                db.add_expense(
-                    trip['trip_id'],
-                    expense_data['amount_to'],
-                    expense_data['amount_from']
-                )
-                
-                # Получить обновлённый баланс
-                trip = db.get_active_trip(user_id)
-                
                 text = (
                     f"✅ Расход учтён!\n\n"
                     f"💸 Потрачено: {format_number(expense_data['amount_to'])} {trip['currency_to']} "
@@ -432,47 +580,49 @@ def callback_confirm_expense(call):
                     f"= {format_number(trip['balance_from'])} {trip['currency_from']}"
                 )
                 
-                bot.edit_message_text(
+                await bot.edit_message_text(
                     chat_id=call.message.chat.id,
                     message_id=call.message.message_id,
                     text=text
                 )
                 
                 # Очистить временные данные
-                if 'pending_expense' in user_states[user_id]:
-                    del user_states[user_id]['pending_expense']
+                del user_state['pending_expense']
+                await user_states.set(user_id, user_state)
             else:
-                bot.answer_callback_query(call.id, "❌ Нет активного путешествия")
+                await bot.answer_callback_query(call.id, "❌ Нет активного путешествия")
         else:
-            bot.answer_callback_query(call.id, "❌ Данные устарели")
+            await bot.answer_callback_query(call.id, "❌ Данные устарели")
     else:
-        bot.edit_message_text(
+        await bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text="❌ Расход не учтён."
         )
-        if user_id in user_states and 'pending_expense' in user_states[user_id]:
-            del user_states[user_id]['pending_expense']
+        if user_state and 'pending_expense' in user_state:
+            del user_state['pending_expense']
+            await user_states.set(user_id, user_state)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("confirm_rate_"))
-def callback_confirm_rate(call):
-    """Подтверждение использования курса API"""
+@callbacks.route("confirm_rate")
+async def callback_confirm_rate(call, action):
+    """Подтверждение использования курса API (action: yes или no)"""
     user_id = call.from_user.id
-    action = call.data.split("_")[2]  # yes или no
     
-    if user_id not in user_states or 'trip_creation' not in user_states[user_id]:
-        bot.answer_callback_query(call.id, "❌ Данные устарели")
+    user_state = await user_states.get(user_id)
+    if not user_state or 'trip_creation' not in user_state:
+        await bot.answer_callback_query(call.id, "❌ Данные устарели")
         return
     
-    trip_data = user_states[user_id]['trip_creation']
+    trip_data = user_state['trip_creation']
     
     if action == "yes":
         # Использовать курс API
-        user_states[user_id]['state'] = 'waiting_initial_amount'
-        user_states[user_id]['trip_creation']['exchange_rate'] = trip_data['api_rate']
+        user_state['state'] = 'waiting_initial_amount'
+        trip_data['exchange_rate'] = trip_data['api_rate']
+        await user_states.set(user_id, user_state)
         
-        bot.edit_message_text(
+        await bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text=(
@@ -483,9 +633,10 @@ def callback_confirm_rate(call):
         )
     else:
         # Запросить ручной ввод курса
-        user_states[user_id]['state'] = 'waiting_manual_rate'
+        user_state['state'] = 'waiting_manual_rate'
+        await user_states.set(user_id, user_state)
         
-        bot.edit_message_text(
+        await bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text=(
@@ -497,37 +648,26 @@ def callback_confirm_rate(call):
 
 
 @bot.message_handler(commands=['newtrip'])
-def newtrip_command(message):
+@HANDLER_LATENCY.timed('command', 'newtrip')
+async def newtrip_command(message):
     """Команда для создания нового путешествия"""
     user_id = message.from_user.id
-    user_states[user_id] = {'state': 'waiting_currency_from'}
+    await user_states.set(user_id, {'state': 'waiting_currency_from'})
     
-    popular_list = "\n".join([f"• {country} ({currency})" for country, currency in sorted(POPULAR_COUNTRIES.items())])
-    
-    bot.send_message(
-        message.chat.id,
-        "✈️ Создание нового путешествия\n\n"
-        "Шаг 1/5: Выберите валюту отправления\n\n"
-        "Вы можете:\n"
-        "1️⃣ Написать название страны из списка ниже\n"
-        "2️⃣ Написать код валюты напрямую (например: RUB, USD, EUR)\n\n"
-        "📍 Популярные направления:\n" + popular_list + "\n\n"
-        "💡 Поддерживаются все мировые валюты!"
-    )
+    await bot.send_message(message.chat.id, get_new_trip_text())
 
 
 @bot.message_handler(commands=['balance'])
-def balance_command(message):
+@HANDLER_LATENCY.timed('command', 'balance')
+async def balance_command(message):
     """Показать баланс активного путешествия"""
     user_id = message.from_user.id
-    trip = db.get_active_trip(user_id)
+    trip, stats = await db.get_active_trip_with_stats(user_id)
     
     if not trip:
-        bot.send_message(message.chat.id, "У вас нет активного путешествия. Создайте новое с помощью /newtrip")
+        await bot.send_message(message.chat.id, "У вас нет активного путешествия. Создайте новое с помощью /newtrip")
         return
     
-    stats = db.get_trip_statistics(trip['trip_id'])
-    
     text = (
         f"💰 Баланс путешествия: {trip['trip_name']}\n\n"
         f"📍 Маршрут: {trip['country_from']} → {trip['country_to']}\n"
@@ -541,78 +681,133 @@ def balance_command(message):
         f"  • Количество расходов: {stats['total_expenses']}"
     )
     
-    bot.send_message(message.chat.id, text)
+    await bot.send_message(message.chat.id, text)
 
 
 @bot.message_handler(commands=['history'])
-def history_command(message):
+@HANDLER_LATENCY.timed('command', 'history')
+async def history_command(message):
     """Показать историю расходов"""
     user_id = message.from_user.id
-    trip = db.get_active_trip(user_id)
+    trip = await db.get_active_trip(user_id)
+    
+    if not trip:
+        await bot.send_message(message.chat.id, "У вас нет активного путешествия.")
+        return
+    
+    page = await db.get_expenses_page(trip['trip_id'], HISTORY_PAGE_SIZE)
+    
+    await bot.send_message(message.chat.id, format_history(trip, page), reply_markup=get_history_keyboard(page))
+
+
+@bot.message_handler(commands=['stats'])
+@HANDLER_LATENCY.timed('command', 'stats')
+async def stats_command(message):
+    """Темп расходов активного путешествия и прогноз, когда закончатся деньги"""
+    user_id = message.from_user.id
+    trip, stats, daily = await db.get_active_trip_daily_spend(user_id, max(MOVING_AVERAGE_WINDOWS))
     
     if not trip:
-        bot.send_message(message.chat.id, "У вас нет активного путешествия.")
+        await bot.send_message(message.chat.id, "У вас нет активного путешествия.")
         return
     
-    expenses = db.get_trip_expenses(trip['trip_id'], limit=15)
+    result = compute_trip_stats(trip, stats, daily)
+    currency = trip['currency_to']
+    averages = ", ".join(
+        f"{window} дн. — {format_number(value)}" for window, value in result['moving_averages'].items()
+    )
     
-    if not expenses:
-        text = f"📊 История расходов: {trip['trip_name']}\n\nПока нет записей о расходах."
+    if trip['balance_to'] <= 0:
+        forecast = "⚠️ Бюджет путешествия исчерпан"
+    elif result['runs_out_on'] is None:
+        forecast = "⏳ За последние дни расходов нет — прогноз пока недоступен"
     else:
-        text = f"📊 История расходов: {trip['trip_name']}\n\n"
-        for exp in expenses:
-            date_str = exp['created_at'].split()[0] if ' ' in exp['created_at'] else exp['created_at']
-            text += (
-                f"📅 {date_str}\n"
-                f"  💸 {format_number(exp['amount_to'])} {trip['currency_to']} "
-                f"= {format_number(exp['amount_from'])} {trip['currency_from']}\n\n"
-            )
+        forecast = (
+            f"⏳ При таком темпе денег хватит примерно на {result['days_left']:.0f} дн. "
+            f"— до {result['runs_out_on'].strftime('%d.%m.%Y')}"
+        )
+    
+    text = (
+        f"📈 Статистика: {trip['trip_name']}\n\n"
+        f"📅 День путешествия: {result['days_elapsed']}\n"
+        f"💸 Сегодня: {format_number(result['spent_today'])} {currency}\n"
+        f"📊 В среднем за день: {format_number(result['average_daily'])} {currency}\n"
+        f"〰️ Скользящее среднее ({currency}): {averages}\n\n"
+        f"🔥 Темп расходов: {format_number(result['burn_rate'])} {currency}/день "
+        f"(≈ {format_number(result['burn_rate'] / trip['exchange_rate'])} {trip['currency_from']})\n"
+        f"💰 Остаток: {format_number(trip['balance_to'])} {currency}\n\n"
+        f"{forecast}"
+    )
     
-    bot.send_message(message.chat.id, text)
+    await bot.send_message(message.chat.id, text)
 
 
-@bot.message_handler(commands=['switch'])
-def switch_command(message):
-    """Переключить активное путешествие"""
+@bot.message_handler(commands=['export'])
+@HANDLER_LATENCY.timed('command', 'export')
+async def export_command(message):
+    """Выгрузить всю историю расходов активного путешествия файлом (/export [csv|parquet])"""
     user_id = message.from_user.id
-    trips = db.get_all_trips(user_id)
+    trip = await db.get_active_trip(user_id)
     
-    if not trips:
-        bot.send_message(message.chat.id, "У вас пока нет путешествий.")
+    if not trip:
+        await bot.send_message(message.chat.id, "У вас нет активного путешествия.")
         return
     
-    keyboard = types.InlineKeyboardMarkup()
-    for trip in trips:
-        status = "✅" if trip['is_active'] else "⭕️"
-        button_text = f"{status} {trip['trip_name']} ({trip['currency_from']} → {trip['currency_to']})"
-        keyboard.add(
-            types.InlineKeyboardButton(
-                button_text,
-                callback_data=f"switch_trip_{trip['trip_id']}"
+    args = message.text.split()[1:]
+    fmt = args[0].lower() if args else "csv"
+    if fmt not in EXPORT_FORMATS:
+        await bot.send_message(message.chat.id, "❌ Формат выгрузки: csv или parquet")
+        return
+    
+    await bot.send_placeholder(message.chat.id, "⏳ Готовлю файл с расходами...")
+    
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        # Запись идёт пачками в отдельном потоке, не блокируя event loop
+        count = await asyncio.to_thread(export_trip, database, trip['trip_id'], path, fmt)
+        with open(path, "rb") as f:
+            await bot.send_document(
+                message.chat.id,
+                f,
+                visible_file_name=f"trip_{trip['trip_id']}.{fmt}",
+                caption=f"📤 {trip['trip_name']}: расходов — {count}"
             )
-        )
+    except RuntimeError as e:
+        await bot.send_message(message.chat.id, f"❌ {e}")
+    finally:
+        os.remove(path)
+
+
+@bot.message_handler(commands=['switch'])
+@HANDLER_LATENCY.timed('command', 'switch')
+async def switch_command(message):
+    """Переключить активное путешествие"""
+    user_id = message.from_user.id
+    page = await db.get_trips_page(user_id, TRIPS_PAGE_SIZE)
     
-    bot.send_message(
-        message.chat.id,
-        "🗂 Ваши путешествия:\n\nНажмите на путешествие, чтобы сделать его активным:",
-        reply_markup=keyboard
-    )
+    if not page['items']:
+        await bot.send_message(message.chat.id, "У вас пока нет путешествий.")
+        return
+    
+    await bot.send_message(message.chat.id, TRIPS_TEXT, reply_markup=get_trips_keyboard(page))
 
 
 @bot.message_handler(commands=['setrate'])
-def setrate_command(message):
+@HANDLER_LATENCY.timed('command', 'setrate')
+async def setrate_command(message):
     """Изменить курс обмена"""
     user_id = message.from_user.id
-    trip = db.get_active_trip(user_id)
+    trip = await db.get_active_trip(user_id)
     
     if not trip:
-        bot.send_message(message.chat.id, "У вас нет активного путешествия.")
+        await bot.send_message(message.chat.id, "У вас нет активного путешествия.")
         return
     
-    user_states[user_id] = {
+    await user_states.set(user_id, {
         'state': 'waiting_new_rate',
         'trip_id': trip['trip_id']
-    }
+    })
     
     text = (
         f"💱 Изменение курса для путешествия: {trip['trip_name']}\n\n"
@@ -620,87 +815,78 @@ def setrate_command(message):
         f"Введите новый курс обмена:"
     )
     
-    bot.send_message(message.chat.id, text)
+    await bot.send_message(message.chat.id, text)
+
+
+@bot.callback_query_handler(func=lambda call: True)
+async def handle_callback(call):
+    """Единая точка входа для callback-кнопок: разбор callback_data и вызов по таблице"""
+    action, args = callbacks.parse_callback(call.data)
+    handler = callbacks.get(action)
+    with HANDLER_LATENCY.time('callback', action or 'unknown'):
+        if handler:
+            await handler(call, *args)
+        else:
+            await bot.answer_callback_query(call.id, "❌ Данные устарели")
 
 
 @bot.message_handler(func=lambda message: True)
-def handle_message(message):
+async def handle_message(message):
     """Обработчик всех текстовых сообщений"""
     user_id = message.from_user.id
     text = message.text.strip()
-    
-    # Проверить, находится ли пользователь в процессе создания путешествия
-    if user_id in user_states:
-        state = user_states[user_id].get('state')
-        
-        if state == 'waiting_currency_from':
-            handle_currency_from(message)
-            return
-        elif state == 'waiting_currency_to':
-            handle_currency_to(message)
-            return
-        elif state == 'waiting_manual_rate':
-            handle_manual_rate(message)
-            return
-        elif state == 'waiting_initial_amount':
-            handle_initial_amount(message)
-            return
-        elif state == 'waiting_new_rate':
-            handle_new_rate_input(message)
-            return
-    
-    # Если сообщение — число, обработать как расход
+    # Метка для метрик: шаг диалога, расход или непонятое сообщение
+    name = 'unknown'
+    started = time.perf_counter()
     try:
-        amount = float(text.replace(',', '.').replace(' ', ''))
-        if amount > 0:
-            handle_expense_amount(message, amount)
-            return
-    except ValueError:
-        pass
-    
-    # Если ничего не подошло, показать справку
-    bot.send_message(
-        message.chat.id,
-        "Я не понял команду. Используйте /menu для вызова главного меню или отправьте число для учёта расходов."
-    )
+        # Проверить, находится ли пользователь в процессе диалога (создание путешествия, ввод курса)
+        user_state = await user_states.get(user_id)
+        if user_state:
+            handler = states.get(user_state.get('state'))
+            if handler:
+                name = user_state.get('state')
+                await handler(message, user_state)
+                return
+        
+        # Если сообщение — число, обработать как расход
+        try:
+            amount = float(text.replace(',', '.').replace(' ', ''))
+            if amount > 0:
+                name = 'expense'
+                await handle_expense_amount(message, amount)
+                return
+        except ValueError:
+            pass
+        
+        # Если ничего не подошло, показать справку
+        await bot.send_message(
+            message.chat.id,
+            "Я не понял команду. Используйте /menu для вызова главного меню или отправьте число для учёта расходов."
+        )
+    finally:
+        HANDLER_LATENCY.observe(time.perf_counter() - started, 'message', name)
 
 
-def handle_currency_from(message):
+@states.route("waiting_currency_from")
+async def handle_currency_from(message, user_state):
     """Обработка ввода валюты/страны отправления"""
     user_id = message.from_user.id
     input_text = message.text.strip()
     
-    # Определить валюту: либо по названию страны, либо по коду валюты
+    # Определить валюту: по названию страны или по коду валюты
     currency = None
     country_name = None
     
-    # Проверить, это название страны?
-    if input_text in POPULAR_COUNTRIES:
-        country_name = input_text
-        currency = POPULAR_COUNTRIES[input_text]
-    # Или это код валюты?
-    elif input_text.upper() in [c.upper() for c in available_currencies.keys()]:
-        currency = input_text.upper()
-        # Найти название страны, если есть
-        for country, curr in POPULAR_COUNTRIES.items():
-            if curr == currency:
-                country_name = country
-                break
-        if not country_name:
-            country_name = get_currency_name(currency)
-    # Попробовать найти частичное совпадение
-    else:
-        input_lower = input_text.lower()
-        for country, curr in POPULAR_COUNTRIES.items():
-            if input_lower in country.lower():
-                country_name = country
-                currency = curr
-                break
+    # Название страны, код валюты или начало названия — поиск по индексу
+    found = currency_index.lookup(input_text)
+    if found:
+        currency, country_name = found
     
     if not currency:
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             f"❌ Валюта или страна '{input_text}' не найдена.\n\n"
+            f"{format_suggestions(input_text)}"
             f"Попробуйте:\n"
             f"• Название страны: Россия, США, Китай\n"
             f"• Код валюты: RUB, USD, CNY, EUR, GBP\n\n"
@@ -708,15 +894,16 @@ def handle_currency_from(message):
         )
         return
     
-    user_states[user_id]['trip_creation'] = {
+    user_state['trip_creation'] = {
         'country_from': country_name or currency,
         'currency_from': currency
     }
-    user_states[user_id]['state'] = 'waiting_currency_to'
+    user_state['state'] = 'waiting_currency_to'
+    await user_states.set(user_id, user_state)
     
-    popular_list = "\n".join([f"• {c} ({curr})" for c, curr in sorted(POPULAR_COUNTRIES.items()) if curr != currency])
+    popular_list = get_popular_list(currency)
     
-    bot.send_message(
+    await bot.send_message(
         message.chat.id,
         f"✅ Валюта отправления: {currency} ({country_name or get_currency_name(currency)})\n\n"
         f"Шаг 2/5: Выберите валюту назначения\n\n"
@@ -725,7 +912,8 @@ def handle_currency_from(message):
     )
 
 
-def handle_currency_to(message):
+@states.route("waiting_currency_to")
+async def handle_currency_to(message, user_state):
     """Обработка ввода валюты/страны назначения"""
     user_id = message.from_user.id
     input_text = message.text.strip()
@@ -734,43 +922,26 @@ def handle_currency_to(message):
     currency = None
     country_name = None
     
-    # Проверить, это название страны?
-    if input_text in POPULAR_COUNTRIES:
-        country_name = input_text
-        currency = POPULAR_COUNTRIES[input_text]
-    # Или это код валюты?
-    elif input_text.upper() in [c.upper() for c in available_currencies.keys()]:
-        currency = input_text.upper()
-        # Найти название страны, если есть
-        for country, curr in POPULAR_COUNTRIES.items():
-            if curr == currency:
-                country_name = country
-                break
-        if not country_name:
-            country_name = get_currency_name(currency)
-    # Попробовать найти частичное совпадение
-    else:
-        input_lower = input_text.lower()
-        for country, curr in POPULAR_COUNTRIES.items():
-            if input_lower in country.lower():
-                country_name = country
-                currency = curr
-                break
+    # Название страны, код валюты или начало названия — поиск по индексу
+    found = currency_index.lookup(input_text)
+    if found:
+        currency, country_name = found
     
     if not currency:
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             f"❌ Валюта или страна '{input_text}' не найдена.\n\n"
+            f"{format_suggestions(input_text)}"
             f"Попробуйте:\n"
             f"• Название страны: Россия, США, Китай\n"
             f"• Код валюты: RUB, USD, CNY, EUR, GBP"
         )
         return
     
-    trip_data = user_states[user_id]['trip_creation']
+    trip_data = user_state['trip_creation']
     
     if currency == trip_data['currency_from']:
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             "❌ Валюта назначения не может совпадать с валютой отправления."
         )
@@ -780,54 +951,59 @@ def handle_currency_to(message):
     trip_data['currency_to'] = currency
     
     # Получить курс через API
-    bot.send_message(message.chat.id, "⏳ Запрашиваю актуальный курс...")
+    await bot.send_placeholder(message.chat.id, "⏳ Запрашиваю актуальный курс...")
     
     try:
-        result = convert_currency(1, trip_data['currency_from'], trip_data['currency_to'])
+        # Обновить таблицу курсов, если пары ещё нет или курс устарел: теми же пачками
+        # и из того же бюджета запросов, что и фоновое обновление. Устаревший курс
+        # обновляется не чаще RATE_REFRESH_MIN_INTERVAL
+        pair = (trip_data['currency_from'], trip_data['currency_to'])
+        rate_table.track(*pair)
+        if not rate_table.has(*pair) or rate_table.is_stale(RATE_MAX_AGE, *pair):
+            try:
+                await rate_refresher.refresh_now(list(pair))
+            except Exception as e:
+                # Без сети остаётся курс из таблицы (например, из снимка на диске)
+                print(f"⚠️ Не удалось обновить курсы: {e}")
         
-        if result.get('success'):
-            # API возвращает курс в info.quote, а результат конвертации в result
-            rate = result.get('info', {}).get('quote')
-            if not rate:
-                # Fallback: используем result если это была конвертация 1 единицы
-                rate = result.get('result')
-            if rate:
-                trip_data['api_rate'] = rate
-                
-                keyboard = types.InlineKeyboardMarkup()
-                keyboard.add(
-                    types.InlineKeyboardButton("✅ Да", callback_data="confirm_rate_yes"),
-                    types.InlineKeyboardButton("❌ Нет", callback_data="confirm_rate_no")
-                )
+        rate = rate_table.get_rate(trip_data['currency_from'], trip_data['currency_to'])
+        if rate:
+            trip_data['api_rate'] = rate
+            await user_states.set(user_id, user_state)
                 
-                bot.send_message(
-                    message.chat.id,
-                    f"✅ Валюта назначения: {country_name or currency} ({currency})\n\n"
-                    f"💱 Текущий курс обмена:\n"
-                    f"1 {trip_data['currency_from']} = {rate:.4f} {currency}\n\n"
-                    f"Шаг 3/5: Использовать этот курс?",
-                    reply_markup=keyboard
-                )
-                return
+            keyboard = types.InlineKeyboardMarkup()
+            keyboard.add(
+                types.InlineKeyboardButton("✅ Да", callback_data="confirm_rate_yes"),
+                types.InlineKeyboardButton("❌ Нет", callback_data="confirm_rate_no")
+            )
+            
+            await bot.send_message(
+                message.chat.id,
+                f"✅ Валюта назначения: {country_name or currency} ({currency})\n\n"
+                f"💱 Текущий курс обмена:\n"
+                f"1 {trip_data['currency_from']} = {rate:.4f} {currency}\n\n"
+                f"Шаг 3/5: Использовать этот курс?",
+                reply_markup=keyboard
+            )
+            return
         
-        # Если API не вернул успешный результат
-        error_msg = result.get('error', {}).get('info', 'Неизвестная ошибка')
-        print(f"❌ API Error: {error_msg}")
-        print(f"Full response: {result}")
-        raise Exception(f"API Error: {error_msg}")
+        # Если API не вернул курс для этой пары
+        raise Exception(f"API Error: нет курса {trip_data['currency_from']} → {trip_data['currency_to']}")
         
     except Exception as e:
         print(f"❌ Exception in currency conversion: {e}")
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             f"⚠️ Не удалось получить курс от API.\n\n"
             f"Шаг 3/5: Пожалуйста, введите курс обмена вручную.\n"
             f"Формат: 1 {trip_data['currency_from']} = ? {trip_data['currency_to']}"
         )
-        user_states[user_id]['state'] = 'waiting_manual_rate'
+        user_state['state'] = 'waiting_manual_rate'
+        await user_states.set(user_id, user_state)
 
 
-def handle_manual_rate(message):
+@states.route("waiting_manual_rate")
+async def handle_manual_rate(message, user_state):
     """Обработка ручного ввода курса"""
     user_id = message.from_user.id
     text = message.text.strip()
@@ -837,24 +1013,26 @@ def handle_manual_rate(message):
         if rate <= 0:
             raise ValueError("Курс должен быть положительным числом")
         
-        trip_data = user_states[user_id]['trip_creation']
+        trip_data = user_state['trip_creation']
         trip_data['exchange_rate'] = rate
-        user_states[user_id]['state'] = 'waiting_initial_amount'
+        user_state['state'] = 'waiting_initial_amount'
+        await user_states.set(user_id, user_state)
         
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             f"✅ Курс принят: 1 {trip_data['currency_from']} = {rate:.4f} {trip_data['currency_to']}\n\n"
             f"Шаг 5/5: Введите начальную сумму в {trip_data['currency_from']}, "
             f"которую вы берёте с собой в путешествие:"
         )
     except ValueError:
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             "❌ Неверный формат. Введите число (например, 12.5)"
         )
 
 
-def handle_initial_amount(message):
+@states.route("waiting_initial_amount")
+async def handle_initial_amount(message, user_state):
     """Обработка ввода начальной суммы"""
     user_id = message.from_user.id
     text = message.text.strip()
@@ -864,23 +1042,18 @@ def handle_initial_amount(message):
         if amount <= 0:
             raise ValueError("Сумма должна быть положительной")
         
-        trip_data = user_states[user_id]['trip_creation']
+        trip_data = user_state['trip_creation']
         
-        # Конвертировать через API для точности
-        bot.send_message(message.chat.id, "⏳ Конвертирую начальную сумму...")
+        # Конвертировать по локальной таблице курсов
+        await bot.send_placeholder(message.chat.id, "⏳ Конвертирую начальную сумму...")
         
-        try:
-            result = convert_currency(amount, trip_data['currency_from'], trip_data['currency_to'])
-            if result.get('success'):
-                converted_amount = result.get('result', amount * trip_data['exchange_rate'])
-            else:
-                converted_amount = amount * trip_data['exchange_rate']
-        except:
+        converted_amount = rate_table.convert(amount, trip_data['currency_from'], trip_data['currency_to'])
+        if converted_amount is None:
             converted_amount = amount * trip_data['exchange_rate']
         
         # Создать путешествие
         trip_name = f"{trip_data['country_from']} → {trip_data['country_to']}"
-        trip_id = db.create_trip(
+        trip_id = await db.create_trip(
             user_id=user_id,
             trip_name=trip_name,
             country_from=trip_data['country_from'],
@@ -893,9 +1066,9 @@ def handle_initial_amount(message):
         )
         
         # Очистить состояние
-        del user_states[user_id]
+        await user_states.delete(user_id)
         
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             f"✅ Путешествие создано!\n\n"
             f"🎉 {trip_name}\n"
@@ -908,13 +1081,14 @@ def handle_initial_amount(message):
         )
         
     except ValueError:
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             "❌ Неверный формат. Введите число (например, 50000)"
         )
 
 
-def handle_new_rate_input(message):
+@states.route("waiting_new_rate")
+async def handle_new_rate_input(message, user_state):
     """Обработка ввода нового курса обмена"""
     user_id = message.from_user.id
     text = message.text.strip()
@@ -924,12 +1098,12 @@ def handle_new_rate_input(message):
         if new_rate <= 0:
             raise ValueError("Курс должен быть положительным")
         
-        trip_id = user_states[user_id]['trip_id']
+        trip_id = user_state['trip_id']
         
-        if db.update_exchange_rate(trip_id, new_rate):
-            trip = db.get_active_trip(user_id)
+        if await db.update_exchange_rate(trip_id, new_rate):
+            trip = await db.get_active_trip(user_id)
             
-            bot.send_message(
+            await bot.send_message(
                 message.chat.id,
                 f"✅ Курс обмена обновлён!\n\n"
                 f"💱 Новый курс: 1 {trip['currency_from']} = {new_rate:.4f} {trip['currency_to']}\n\n"
@@ -939,47 +1113,43 @@ def handle_new_rate_input(message):
             )
             
             # Очистить состояние
-            del user_states[user_id]
+            await user_states.delete(user_id)
         else:
-            bot.send_message(message.chat.id, "❌ Ошибка при обновлении курса")
+            await bot.send_message(message.chat.id, "❌ Ошибка при обновлении курса")
             
     except ValueError:
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             "❌ Неверный формат. Введите число (например, 12.5)"
         )
 
 
-def handle_expense_amount(message, amount):
+async def handle_expense_amount(message, amount):
     """Обработка суммы расхода"""
     user_id = message.from_user.id
-    trip = db.get_active_trip(user_id)
+    trip = await db.get_active_trip(user_id)
     
     if not trip:
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             "У вас нет активного путешествия. Создайте его с помощью /newtrip"
         )
         return
     
-    # Конвертировать сумму из валюты назначения в домашнюю валюту
-    try:
-        result = convert_currency(amount, trip['currency_to'], trip['currency_from'])
-        if result.get('success'):
-            converted_amount = result.get('result', amount / trip['exchange_rate'])
-        else:
-            converted_amount = amount / trip['exchange_rate']
-    except:
+    # Конвертировать сумму из валюты назначения в домашнюю валюту (без сети)
+    converted_amount = rate_table.convert(amount, trip['currency_to'], trip['currency_from'])
+    if converted_amount is None:
+        # Курса нет в таблице — подхватить пару при следующем обновлении
+        rate_table.track(trip['currency_to'], trip['currency_from'])
         converted_amount = amount / trip['exchange_rate']
     
     # Сохранить данные о расходе для подтверждения
-    if user_id not in user_states:
-        user_states[user_id] = {}
-    
-    user_states[user_id]['pending_expense'] = {
+    user_state = await user_states.get(user_id) or {}
+    user_state['pending_expense'] = {
         'amount_to': amount,
         'amount_from': converted_amount
     }
+    await user_states.set(user_id, user_state)
     
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(
@@ -987,7 +1157,7 @@ def handle_expense_amount(message, amount):
         types.InlineKeyboardButton("❌ Нет", callback_data="confirm_expense_no")
     )
     
-    bot.send_message(
+    await bot.send_message(
         message.chat.id,
         f"💸 {format_number(amount)} {trip['currency_to']} = {format_number(converted_amount)} {trip['currency_from']}\n\n"
         f"Учесть как расход?",
@@ -995,13 +1165,168 @@ def handle_expense_amount(message, amount):
     )
 
 
-if __name__ == "__main__":
-    print("🤖 Бот запускается...")
+def restore_snapshot() -> bool:
+    """Загрузить справочник валют и курсы из снимка на диске"""
+    snapshot = load_snapshot()
+    if not snapshot:
+        return False
+    apply_snapshot(snapshot)
+    return True
+
+
+async def follow_snapshot():
+    """Подхватить курсы, сохранённые в снимок другим воркером.
+
+    Более свежие котировки, которые воркер успел загрузить сам, остаются.
+    """
+    snapshot = await asyncio.to_thread(load_snapshot)
+    if snapshot:
+        apply_snapshot(snapshot)
+
+
+def apply_snapshot(snapshot: dict):
+    """Заменить справочник валют данными снимка и добавить его курсы в таблицу"""
+    global available_currencies
+    if snapshot['currencies']:
+        available_currencies = snapshot['currencies']
+        build_currency_index()
+    rate_table.restore(snapshot['rates'], snapshot['updated_at'], snapshot['base'])
+    print(
+        f"💾 Из снимка загружено {len(available_currencies)} валют и {len(rate_table.rates)} курсов "
+        f"(возраст {snapshot_age(snapshot) / 60:.0f} мин)"
+    )
+
+
+async def store_snapshot():
+    """Сохранить текущие справочник валют и курсы на диск"""
+    try:
+        await asyncio.to_thread(
+            save_snapshot, rate_table.base, rate_table.rates, rate_table.updated_at, available_currencies
+        )
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить снимок курсов: {e}")
+
+
+# Фоновое обновление курсов: валюты активных путешествий в приоритете
+rate_refresher = RateRefresher(rate_table, load_usage=db.get_active_currency_usage, on_refresh=store_snapshot)
+# Воркеры webhook, которые не обращаются к API сами, берут курсы из снимка
+snapshot_watcher = SnapshotWatcher(on_change=follow_snapshot)
+
+
+# Метрики, которые уже считают сами объекты бота: читаются только при запросе /metrics
+@gauge("travel_wallet_cache_hit_ratio", "Доля попаданий в кэш", ("cache",))
+def collect_cache_hit_ratio():
+    popular = get_popular_list.cache_info()
+    lookups = popular.hits + popular.misses
+    return {
+        ('api',): get_cache_stats()['hit_ratio'],
+        ('popular_list',): popular.hits / lookups if lookups else 0.0,
+    }
+
+
+@counter("travel_wallet_cache_events_total", "Обращения к кэшу ответов API курсов", ("event",))
+def collect_cache_events():
+    stats = get_cache_stats()
+    return {(event,): stats[event] for event in ('hits', 'stale_hits', 'misses', 'evictions', 'coalesced')}
+
+
+@gauge("travel_wallet_queue_depth", "Глубина очередей", ("queue",))
+def collect_queue_depth():
+    depths = {
+        ('outbound',): bot.pending_sends(),
+        ('placeholders',): len(bot.placeholders),
+        ('background_tasks',): len(background_tasks),
+        ('db_calls',): db.inflight,
+    }
+    if database.batch_writer is not None:
+        depths[('db_batch',)] = database.batch_writer.queue.qsize()
+    return depths
+
+
+@counter("travel_wallet_telegram_retries_total", "Повторы отправки после ответа 429")
+def collect_telegram_retries():
+    return bot.retries_429
+
+
+@counter("travel_wallet_placeholders_skipped_total", "Заглушки «⏳», которые не пришлось отправлять")
+def collect_placeholders_skipped():
+    return bot.placeholders_skipped
+
+
+@gauge("travel_wallet_rate_table_age_seconds", "Возраст таблицы курсов")
+def collect_rate_table_age():
+    return time.time() - rate_table.updated_at if rate_table.updated_at else 0.0
+
+
+async def refresh_reference_data():
+    """Загрузить справочник валют и таблицу курсов из API и сохранить снимок"""
     print("📡 Загрузка списка валют из API...")
-    if load_available_currencies():
+    if await load_available_currencies():
         print(f"✅ Загружено {len(available_currencies)} валют")
     else:
         print("⚠️ Не удалось загрузить валюты из API, будут доступны только популярные")
+    print("📡 Загрузка таблицы курсов...")
+    try:
+        if await rate_refresher.refresh_once():
+            print(f"✅ Загружено {len(rate_table.rates)} курсов")
+        else:
+            print("⚠️ Не удалось загрузить курсы, будет использоваться курс путешествия")
+    except Exception as e:
+        print(f"⚠️ Ошибка при загрузке курсов: {e}")
+
+
+def start_background_task(coro):
+    """Запустить задачу, которая будет остановлена при shutdown()"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def startup(metrics_port: int = METRICS_PORT, refresh_rates: bool = True):
+    """Подготовить справочники валют и таблицу курсов перед обработкой обновлений.
+
+    Если есть снимок на диске, бот стартует сразу с ним, а свежие данные
+    загружаются в фоне; без снимка загрузка из API выполняется до старта.
+    Дальше курсы обновляет фоновая задача rate_refresher. С refresh_rates=False
+    (воркеры webhook, кроме одного) курсы по расписанию не загружаются, а
+    берутся из снимка, который сохраняет обновляющий воркер.
+    """
+    global metrics_runner
+    metrics_runner = await start_metrics_server(port=metrics_port)
+    restored = restore_snapshot()
+    rate_table.track(*POPULAR_COUNTRIES.values())
+    rate_table.track(*await db.get_used_currencies())
+    if not refresh_rates:
+        start_background_task(snapshot_watcher.run())
+        return
+    if restored:
+        start_background_task(refresh_reference_data())
+    else:
+        await refresh_reference_data()
+    start_background_task(rate_refresher.run())
+
+
+async def shutdown():
+    """Остановить фоновые задачи и закрыть HTTP-сессии"""
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await close_async_client()
+    await bot.close_session()
+
+
+async def main():
+    """Точка входа в режиме polling"""
+    print("🤖 Бот запускается...")
+    await startup()
     print("🚀 Бот запущен и готов к работе!")
-    bot.infinity_polling()
+    try:
+        await bot.infinity_polling()
+    finally:
+        await shutdown()
 
+
+if __name__ == "__main__":
+    asyncio.run(main())
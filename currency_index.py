@@ -0,0 +1,92 @@
+import difflib
+from typing import Dict, List, Optional, Tuple
+
+# Начало названия короче этого не выбирает страну даже при единственном совпадении
+MIN_PREFIX_LENGTH = 2
+
+
+def normalize(text: str) -> str:
+    """Привести ввод к виду для поиска: нижний регистр, ё → е, одиночные пробелы"""
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+class CurrencyIndex:
+    """Индекс для поиска валюты по коду, названию страны или его началу.
+
+    Строится один раз при загрузке списка валют; точный поиск и поиск по
+    началу слова — обращения к словарю. Начало названия выбирает страну,
+    только если подходит ровно одна; при нескольких совпадениях и для
+    ввода с опечатками suggest() возвращает упорядоченные варианты.
+    """
+
+    def __init__(self, countries: Dict[str, str], currencies: Dict[str, str] = None):
+        currencies = currencies or {}
+        # Код → название валюты из API
+        self.currency_names = {code.upper(): name for code, name in currencies.items()}
+        # Нормализованный код → код
+        self.codes = {normalize(code): code.upper() for code in currencies}
+        # Нормализованное название страны → (страна, код)
+        self.countries = {}
+        # Код → первая страна с этой валютой
+        self.country_by_code = {}
+        # Начало любого слова названия → [(страна, код, начало слова), ...] всех совпадений
+        self.prefixes = {}
+
+        for country, code in countries.items():
+            key = normalize(country)
+            self.codes.setdefault(normalize(code), code)
+            self.countries[key] = (country, code)
+            self.country_by_code.setdefault(code, country)
+            for start in self._word_starts(key):
+                for end in range(start + 1, len(key) + 1):
+                    candidates = self.prefixes.setdefault(key[start:end], [])
+                    if not any(candidate[0] == country for candidate in candidates):
+                        candidates.append((country, code, start))
+
+        # Варианты для нечёткого поиска: страны, названия валют и коды
+        self.choices = {key: (country, code) for key, (country, code) in self.countries.items()}
+        for code, name in self.currency_names.items():
+            self.choices.setdefault(normalize(name), (self.country_by_code.get(code, name), code))
+            self.choices.setdefault(normalize(code), (self.country_by_code.get(code, name), code))
+
+    @staticmethod
+    def _word_starts(text: str) -> List[int]:
+        return [0] + [i + 1 for i, char in enumerate(text) if char in " -"]
+
+    def name_for(self, code: str) -> str:
+        """Страна или название валюты для кода"""
+        return self.country_by_code.get(code) or self.currency_names.get(code) or code
+
+    def lookup(self, text: str) -> Optional[Tuple[str, str]]:
+        """Найти валюту: (код, название страны) или None"""
+        key = normalize(text)
+        if not key:
+            return None
+        if key in self.countries:
+            country, code = self.countries[key]
+            return code, country
+        if key in self.codes:
+            code = self.codes[key]
+            return code, self.name_for(code)
+        candidates = self.prefixes.get(key, [])
+        if len(key) >= MIN_PREFIX_LENGTH and len(candidates) == 1:
+            country, code, _ = candidates[0]
+            return code, country
+        return None
+
+    def suggest(self, text: str, limit: int = 3) -> List[Tuple[str, str]]:
+        """Варианты для неоднозначного ввода или ввода с опечаткой: [(код, название), ...].
+
+        Сначала страны, название которых начинается с ввода, затем страны
+        с подходящим началом другого слова, затем нечёткие совпадения.
+        """
+        key = normalize(text)
+        suggestions = []
+        for country, code, start in sorted(self.prefixes.get(key, []), key=lambda c: (c[2] > 0, c[0])):
+            if (code, country) not in suggestions:
+                suggestions.append((code, country))
+        for match in difflib.get_close_matches(key, self.choices, n=limit * 2, cutoff=0.6):
+            country, code = self.choices[match]
+            if (code, country) not in suggestions:
+                suggestions.append((code, country))
+        return suggestions[:limit]
@@ -1,40 +1,649 @@
+import asyncio
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+import math
 import os
+import random
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from metrics import UPSTREAM_LATENCY
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy курсы хранятся в array('d'), пакетные операции — в цикле
+    np = None
 
 load_dotenv()
 
-def get_current_rate(default: str = "USD", currencies: list[str] = ["USD", "EUR", "GBP", "JPY", "KRW", "CNY", "INR", "BRL", "MXN", "ARS", "CLP", "COP", "PEN", "UYU", "VEF", "VND", "ZAR", "TRY", "RUB", "UAH", "KZT", "KGS", "TJS", "TMT", "AZN", "AMD", "BYN"]):
-    url = f"https://api.exchangerate.host/live"
+API_URL = "https://api.exchangerate.host"
+
+DEFAULT_CURRENCIES = ["USD", "EUR", "GBP", "JPY", "KRW", "CNY", "INR", "BRL", "MXN", "ARS", "CLP", "COP", "PEN", "UYU", "VEF", "VND", "ZAR", "TRY", "RUB", "UAH", "KZT", "KGS", "TJS", "TMT", "AZN", "AMD", "BYN"]
+
+# Настройки HTTP-клиента
+CONNECT_TIMEOUT = float(os.getenv("CURRENCY_CONNECT_TIMEOUT", 3))
+READ_TIMEOUT = float(os.getenv("CURRENCY_READ_TIMEOUT", 5))
+MAX_RETRIES = int(os.getenv("CURRENCY_MAX_RETRIES", 2))
+
+# Настройки кэша ответов API
+CACHE_TTL = int(os.getenv("CURRENCY_CACHE_TTL", 300))
+CACHE_SIZE = int(os.getenv("CURRENCY_CACHE_SIZE", 1024))
+LIST_CACHE_TTL = int(os.getenv("CURRENCY_LIST_CACHE_TTL", 86400))
+
+
+class CircuitOpenError(Exception):
+    """API недоступно, запросы временно не выполняются"""
+
+
+class CircuitBreaker:
+    """Размыкатель: после серии сбоев запросы сразу отклоняются на reset_timeout секунд"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # Пропустить один пробный запрос, остальные ждут следующего окна
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+class CurrencyClient:
+    """HTTP-клиент exchangerate.host с пулом соединений, таймаутами,
+    повторами с экспоненциальной задержкой и размыкателем"""
+
+    def __init__(self, base_url: str = API_URL, timeout: tuple = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 retries: int = MAX_RETRIES, backoff: float = 0.5, max_backoff: float = 4,
+                 pool_size: int = 10):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker()
+        # Запросы в полёте: одинаковые одновременные запросы ждут один ответ
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+        self.coalesced = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @staticmethod
+    def request_key(endpoint: str, params: dict = None) -> tuple:
+        return endpoint, tuple(sorted((params or {}).items()))
+
+    def get(self, endpoint: str, params: dict = None, on_request=None) -> dict:
+        """GET-запрос к API; при недоступности API выбрасывает исключение.
+
+        Если такой же запрос уже выполняется в другом потоке, ждёт его ответа
+        вместо повторного обращения к API. on_request() вызывается, только
+        когда запрос действительно уходит в API (например, для учёта квоты).
+        """
+        key = self.request_key(endpoint, params)
+        with self.inflight_lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            if on_request:
+                on_request()
+            future.set_result(self._request(endpoint, params))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self.inflight_lock:
+                del self.inflight[key]
+        return future.result()
+
+    def _request(self, endpoint: str, params: dict = None) -> dict:
+        if not self.breaker.allow():
+            raise CircuitOpenError("API курсов временно недоступно")
+
+        params = dict(params or {}, access_key=os.getenv("CURRENCY_ACCESS_KEY"))
+        url = f"{self.base_url}/{endpoint}"
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff_delay(attempt))
+            started = time.perf_counter()
+            status = "error"
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                status = str(response.status_code)
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.raise_for_status()
+                data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                error = e
+                continue
+            finally:
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint, status)
+            self.breaker.record_success()
+            return data
+
+        self.breaker.record_failure()
+        raise error
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Экспоненциальная задержка с полным джиттером"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+class AsyncCurrencyClient(CurrencyClient):
+    """Асинхронный вариант клиента на aiohttp с теми же таймаутами, повторами и размыкателем"""
+
+    def __init__(self, base_url: str = API_URL, timeout: tuple = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 retries: int = MAX_RETRIES, backoff: float = 0.5, max_backoff: float = 4,
+                 pool_size: int = 10, breaker: CircuitBreaker = None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.inflight = {}
+        self.coalesced = 0
+        self.session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессия создаётся лениво, внутри работающего event loop
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+            )
+        return self.session
+
+    async def get(self, endpoint: str, params: dict = None, on_request=None) -> dict:
+        """GET-запрос к API; при недоступности API выбрасывает исключение.
+
+        Одновременные одинаковые запросы ждут одну общую задачу; on_request()
+        вызывает только тот, кто её запустил.
+        """
+        key = self.request_key(endpoint, params)
+        task = self.inflight.get(key)
+        if task is None:
+            if on_request:
+                on_request()
+            task = asyncio.ensure_future(self._request(endpoint, params))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    async def _request(self, endpoint: str, params: dict = None) -> dict:
+        if not self.breaker.allow():
+            raise CircuitOpenError("API курсов временно недоступно")
+
+        params = dict(params or {}, access_key=os.getenv("CURRENCY_ACCESS_KEY") or "")
+        url = f"{self.base_url}/{endpoint}"
+        session = self._get_session()
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff_delay(attempt))
+            started = time.perf_counter()
+            status = "error"
+            try:
+                async with session.get(url, params=params) as response:
+                    status = str(response.status)
+                    if response.status == 429 or response.status >= 500:
+                        response.raise_for_status()
+                    data = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = e
+                continue
+            finally:
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint, status)
+            self.breaker.record_success()
+            return data
+
+        self.breaker.record_failure()
+        raise error
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+_client = CurrencyClient()
+_async_client = AsyncCurrencyClient(breaker=_client.breaker)
+
+
+class TTLCache:
+    """Кэш ответов API с TTL, вытеснением LRU и stale-while-revalidate.
+
+    Просроченное значение отдаётся сразу, а свежее загружается в фоновом
+    потоке. Сохраняются только успешные ответы (success=True).
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, maxsize: int = CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.refreshing = set()
+        self.tasks = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """Найти значение: (value, "hit" | "stale" | "refreshing" | "miss")"""
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, "miss"
+            self.data.move_to_end(key)
+            value, expires_at = entry
+            if expires_at > time.time():
+                self.hits += 1
+                return value, "hit"
+            self.stale_hits += 1
+            if key in self.refreshing:
+                return value, "refreshing"
+            self.refreshing.add(key)
+            return value, "stale"
+
+    def get(self, key, loader, ttl: float = None):
+        """Вернуть значение по ключу, при промахе загрузить через loader()"""
+        value, status = self.lookup(key)
+        if status == "stale":
+            threading.Thread(target=self._refresh, args=(key, loader, ttl), daemon=True).start()
+        if status != "miss":
+            return value
+
+        value = loader()
+        self.set(key, value, ttl)
+        return value
+
+    async def aget(self, key, loader, ttl: float = None):
+        """Асинхронный get(): loader — корутинная функция, обновление идёт фоновой задачей"""
+        value, status = self.lookup(key)
+        if status == "stale":
+            task = asyncio.get_running_loop().create_task(self._arefresh(key, loader, ttl))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        if status != "miss":
+            return value
+
+        value = await loader()
+        self.set(key, value, ttl)
+        return value
+
+    def revalidate(self, key, loader, ttl: float = None):
+        """Загрузить значение через loader() в обход кэша и сохранить его"""
+        value = loader()
+        self.set(key, value, ttl)
+        return value
+
+    async def arevalidate(self, key, loader, ttl: float = None):
+        """Асинхронный revalidate(): дождаться loader() даже при записи в кэше"""
+        value = await loader()
+        self.set(key, value, ttl)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        if not value.get('success'):
+            return
+        with self.lock:
+            self.data[key] = (value, time.time() + (ttl or self.ttl))
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def _refresh(self, key, loader, ttl):
+        try:
+            self.set(key, loader(), ttl)
+        except Exception as e:
+            print(f"Ошибка при фоновом обновлении {key}: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    async def _arefresh(self, key, loader, ttl):
+        try:
+            self.set(key, await loader(), ttl)
+        except Exception as e:
+            print(f"Ошибка при фоновом обновлении {key}: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'size': len(self.data),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else 0.0
+            }
+
+
+_cache = TTLCache()
+
+
+def get_cache_stats() -> dict:
+    """Счётчики кэша для подбора TTL под квоту API"""
+    # coalesced — сколько запросов дождались уже выполняющегося одинакового запроса
+    return dict(_cache.stats(), coalesced=_client.coalesced + _async_client.coalesced)
+
+
+def get_current_rate(default: str = "USD", currencies: list[str] = DEFAULT_CURRENCIES,
+                     revalidate: bool = False, on_request=None):
     params = {
-        "access_key": os.getenv("CURRENCY_ACCESS_KEY"),
         "source": default,
         "currencies": ",".join(currencies)
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    return data
+
+    def load():
+        return _client.get("live", params, on_request)
+
+    # revalidate=True — запросить API, даже если в кэше есть ответ (свежий или просроченный)
+    key = ("live", default, tuple(currencies))
+    if revalidate:
+        return _cache.revalidate(key, load)
+    return _cache.get(key, load)
 
 def convert_currency(amount: float, from_currency: str, to_currency: str):
-    url = "https://api.exchangerate.host/convert"
-    params = {
-        "access_key": os.getenv("CURRENCY_ACCESS_KEY"),
-        "from": from_currency,
-        "to": to_currency,
-        "amount": amount
-    }
-    response = requests.get(url, params=params)
-    data = response.json()
-    return data
+    # Курс пары — отношение двух котировок к USD: один запрос /live покрывает все валюты
+    _rates.track(from_currency, to_currency)
+    if not _rates.has(from_currency, to_currency) or _rates.is_stale(CACHE_TTL, from_currency, to_currency):
+        _rates.refresh()
+    return _scale_conversion(_cross_quote(from_currency, to_currency), amount)
 
 def get_all_supported_currencies():
-    url = "https://api.exchangerate.host/list"
+    def load():
+        return _client.get("list")
+
+    return _cache.get(("list",), load, ttl=LIST_CACHE_TTL)
+
+
+def _cross_quote(from_currency: str, to_currency: str) -> dict:
+    """Ответ в формате /convert для 1 единицы по кросс-курсу из общей таблицы"""
+    rate = _rates.get_rate(from_currency, to_currency)
+    if rate is None:
+        return {'success': False, 'error': {'info': f"Нет курса {from_currency} → {to_currency}"}}
+    return {
+        'success': True,
+        'query': {'from': from_currency, 'to': to_currency, 'amount': 1},
+        'info': {'timestamp': int(_rates.quoted_time(from_currency, to_currency)), 'quote': rate},
+        'result': rate
+    }
+
+
+def _scale_conversion(data: dict, amount: float) -> dict:
+    """Пересчитать ответ /convert для 1 единицы на нужную сумму"""
+    if not data.get('success'):
+        return data
+    quote = data.get('info', {}).get('quote') or data.get('result')
+    result = dict(data)
+    result['query'] = dict(data.get('query', {}), amount=amount)
+    result['result'] = amount * quote if quote else None
+    return result
+
+
+async def async_get_current_rate(default: str = "USD", currencies: list[str] = DEFAULT_CURRENCIES,
+                                 revalidate: bool = False, on_request=None):
+    """Асинхронный вариант get_current_rate"""
     params = {
-        "access_key": os.getenv("CURRENCY_ACCESS_KEY"),
+        "source": default,
+        "currencies": ",".join(currencies)
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    return data
+
+    def load():
+        return _async_client.get("live", params, on_request)
+
+    key = ("live", default, tuple(currencies))
+    if revalidate:
+        return await _cache.arevalidate(key, load)
+    return await _cache.aget(key, load)
+
+
+async def async_convert_currency(amount: float, from_currency: str, to_currency: str):
+    """Асинхронный вариант convert_currency"""
+    _rates.track(from_currency, to_currency)
+    if not _rates.has(from_currency, to_currency) or _rates.is_stale(CACHE_TTL, from_currency, to_currency):
+        await _rates.async_refresh()
+    return _scale_conversion(_cross_quote(from_currency, to_currency), amount)
+
+
+async def async_get_all_supported_currencies():
+    """Асинхронный вариант get_all_supported_currencies"""
+    def load():
+        return _async_client.get("list")
+
+    return await _cache.aget(("list",), load, ttl=LIST_CACHE_TTL)
+
+
+async def close_async_client():
+    """Закрыть HTTP-сессию асинхронного клиента при остановке бота"""
+    await _async_client.close()
+
+
+class RateTable:
+    """Локальная таблица курсов относительно одной базовой валюты.
+
+    Котировки загружаются пачкой через /live (get_current_rate) и хранятся
+    вектором: код валюты → позиция в массиве. Кросс-курс любой пары — деление
+    двух элементов, пакетная конвертация (convert_many) векторизована через
+    NumPy, если он установлен.
+    """
+
+    def __init__(self, base: str = "USD"):
+        self.base = base
+        # Индекс и вектор котировок заменяются вместе одной парой
+        self.quotes = ({base: 0}, self._vector([1.0]))
+        # Метка времени из ответа API по каждой валюте, кроме базовой
+        self.quoted_at = {}
+        self.tracked = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _vector(values):
+        if np is not None:
+            return np.array(values, dtype=np.float64)
+        return array("d", values)
+
+    @property
+    def rates(self) -> dict:
+        """Котировки словарём {код: курс к базовой валюте}"""
+        index, vector = self.quotes
+        return {code: float(vector[i]) for code, i in index.items()}
+
+    @rates.setter
+    def rates(self, rates: dict):
+        quotes = self._build(rates)
+        with self.lock:
+            self.quotes = quotes
+            self.quoted_at = {code: at for code, at in self.quoted_at.items() if code in rates}
+
+    @property
+    def updated_at(self) -> float:
+        """Время самой старой котировки в таблице; 0, если котировок нет"""
+        return self.quoted_time()
+
+    def quoted_time(self, *codes: str) -> float:
+        """Время самой старой котировки среди codes (без аргументов — всех валют таблицы).
+
+        0, если котировки какой-то из валют нет.
+        """
+        quoted_at = self.quoted_at
+        codes = [code for code in codes if code != self.base] if codes else list(quoted_at)
+        return min((quoted_at.get(code, 0.0) for code in codes), default=0.0)
+
+    def _build(self, rates: dict) -> tuple:
+        codes = list(rates)
+        return {code: i for i, code in enumerate(codes)}, self._vector([rates[code] for code in codes])
+
+    def _merge(self, rates: dict, quoted_at: float):
+        """Добавить котировки с одной меткой времени: по каждой валюте остаётся более новая"""
+        with self.lock:
+            merged = self.rates
+            stamps = dict(self.quoted_at)
+            for code, quote in rates.items():
+                if code == self.base or stamps.get(code, 0.0) > quoted_at:
+                    continue
+                merged[code] = quote
+                stamps[code] = quoted_at
+            self.quotes = self._build(merged)
+            self.quoted_at = stamps
+
+    def track(self, *codes: str):
+        """Добавить валюты в список обновляемых"""
+        with self.lock:
+            self.tracked.update(code.upper() for code in codes if code)
+
+    def refresh(self, currencies: list = None, revalidate: bool = False, on_request=None) -> bool:
+        """Загрузить свежие котировки одним запросом.
+
+        Без аргумента обновляются все отслеживаемые валюты. Котировки
+        сливаются с уже известными: по каждой валюте остаётся более новая.
+        С revalidate=True ответ берётся из API, а не из кэша ответов;
+        on_request() вызывается перед каждым обращением к API.
+        Возвращает False, если успешного ответа нет.
+        """
+        currencies = self._currencies(currencies)
+        if not currencies:
+            return False
+        return self._apply(get_current_rate(self.base, currencies, revalidate, on_request))
+
+    async def async_refresh(self, currencies: list = None, revalidate: bool = False,
+                            on_request=None) -> bool:
+        """Асинхронный вариант refresh()"""
+        currencies = self._currencies(currencies)
+        if not currencies:
+            return False
+        return self._apply(await async_get_current_rate(self.base, currencies, revalidate, on_request))
+
+    def _currencies(self, currencies: list = None) -> list:
+        if currencies is not None:
+            return sorted(set(currencies) - {self.base})
+        with self.lock:
+            return sorted(self.tracked - {self.base})
+
+    def _apply(self, data: dict) -> bool:
+        if not data.get('success'):
+            return False
+        # Возраст котировок — по метке времени самого ответа: просроченный ответ
+        # из кэша (stale-while-revalidate) не должен выглядеть свежим
+        quoted_at = min(float(data.get('timestamp') or time.time()), time.time())
+        source = data.get('source', self.base)
+        rates = {}
+        for pair, quote in data.get('quotes', {}).items():
+            if quote:
+                rates[pair[len(source):]] = float(quote)
+        self._merge(rates, quoted_at)
+        return True
+
+    def restore(self, rates: dict, updated_at: float, base: str = None) -> bool:
+        """Добавить сохранённые котировки (например, из снимка на диске).
+
+        Всем котировкам снимка присваивается его метка времени; более свежие
+        котировки, уже загруженные в таблицу, не заменяются.
+        """
+        base = base or self.base
+        if base != self.base:
+            # Пересчитать котировки к своей базовой валюте
+            if not rates.get(self.base):
+                return False
+            unit = rates[self.base]
+            rates = {code: quote / unit for code, quote in rates.items()}
+        self._merge(rates, updated_at)
+        return True
+
+    def has(self, *codes: str) -> bool:
+        index = self.quotes[0]
+        return all(code in index for code in codes)
+
+    def is_stale(self, max_age: float, *codes: str) -> bool:
+        """Старше ли max_age самая старая котировка среди codes (без аргументов — всей таблицы)"""
+        return time.time() - self.quoted_time(*codes) > max_age
+
+    def get_rate(self, from_currency: str, to_currency: str):
+        """Кросс-курс: сколько единиц to_currency стоит 1 from_currency"""
+        index, vector = self.quotes
+        i = index.get(from_currency)
+        j = index.get(to_currency)
+        if i is None or j is None or not vector[i]:
+            return None
+        return float(vector[j] / vector[i])
+
+    def convert(self, amount: float, from_currency: str, to_currency: str):
+        """Конвертировать сумму по локальной таблице; None, если курса нет"""
+        rate = self.get_rate(from_currency, to_currency)
+        if rate is None:
+            return None
+        return amount * rate
+
+    def convert_many(self, amounts, from_currencies, to_currencies) -> list:
+        """Конвертировать пачку сумм: i-я сумма из from_currencies[i] в to_currencies[i].
+
+        Возвращает список результатов; None там, где курса нет.
+        """
+        index, vector = self.quotes
+        size = len(vector)
+        # Отсутствующая валюта получает позицию size — за пределами вектора
+        positions_from = [index.get(code, size) for code in from_currencies]
+        positions_to = [index.get(code, size) for code in to_currencies]
+
+        if np is None:
+            padded = list(vector) + [0.0]
+            return [
+                amount * padded[j] / padded[i] if padded[i] and j < size else None
+                for amount, i, j in zip(amounts, positions_from, positions_to)
+            ]
+
+        padded = np.append(vector, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = np.asarray(amounts, dtype=np.float64) * padded[positions_to] / padded[positions_from]
+        return [value if math.isfinite(value) else None for value in result.tolist()]
+
+
+# Общая таблица котировок для convert_currency
+_rates = RateTable()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,210 @@
+import asyncio
+import functools
+import queue
 import sqlite3
-from typing import Optional, List, Dict
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, List, Dict, Iterator, Tuple
 from datetime import datetime
 
+from metrics import DB_LATENCY
+from migrations import run_migrations
+
+
+class ConnectionPool:
+    """Потокобезопасный пул долгоживущих соединений SQLite.
+
+    Соединения открываются один раз в режиме WAL, поэтому читатели
+    не блокируют запись и не переоткрывают файл базы на каждый запрос.
+    """
+
+    def __init__(self, db_name: str, size: int = 5, busy_timeout: int = 5000, cache_size_kb: int = 8192):
+        self.db_name = db_name
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.cache_size_kb = cache_size_kb
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _connect(self, synchronous: str = "NORMAL") -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout / 1000, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Взять соединение из пула; если все заняты и лимит исчерпан — подождать"""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                return self._connect()
+        return self.idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        """Вернуть соединение в пул, откатив незавершённую транзакцию"""
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# SQL частых запросов. Методы DatabaseManager и проверка планов (check_query_plans,
+# tests/test_query_plans.py) используют одни и те же строки
+ACTIVE_TRIP_QUERY = """
+    SELECT trip_id, trip_name, country_from, country_to, 
+           currency_from, currency_to, exchange_rate, 
+           initial_amount_from, balance_from, balance_to,
+           expense_count, spent_from, spent_to
+    FROM trips 
+    WHERE user_id = ? AND is_active = 1
+"""
+ALL_TRIPS_QUERY = """
+    SELECT trip_id, trip_name, country_from, country_to, 
+           currency_from, currency_to, exchange_rate, 
+           balance_from, balance_to, is_active
+    FROM trips 
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+"""
+TRIP_EXPENSES_QUERY = """
+    SELECT expense_id, amount_to, amount_from, description, created_at
+    FROM expenses
+    WHERE trip_id = ?
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+EXPORT_EXPENSES_QUERY = """
+    SELECT e.expense_id, e.created_at, e.amount_to, t.currency_to,
+           e.amount_from, t.currency_from, e.description
+    FROM expenses e
+    JOIN trips t ON t.trip_id = e.trip_id
+    WHERE e.trip_id = ?
+    ORDER BY e.created_at, e.expense_id
+"""
+DAILY_SPEND_QUERY = """
+    SELECT day, spent_from, spent_to, expense_count
+    FROM trip_daily_spend
+    WHERE trip_id = ? AND day > date('now', ?)
+    ORDER BY day
+"""
+USER_STATE_QUERY = """
+    SELECT data FROM user_states WHERE user_id = ? AND expires_at > ?
+"""
+TRIP_STATISTICS_QUERY = """
+    SELECT expense_count, spent_from, spent_to
+    FROM trips
+    WHERE trip_id = ?
+"""
+
+# Постраничные списки: (запрос, столбцы, ключ курсора, запрос значения ключа по id)
+TRIPS_PAGE = (
+    """
+    SELECT trip_id, trip_name, country_from, country_to,
+           currency_from, currency_to, exchange_rate,
+           balance_from, balance_to, is_active
+    FROM trips
+    WHERE user_id = ?
+    """,
+    ('trip_id', 'trip_name', 'country_from', 'country_to', 'currency_from', 'currency_to',
+     'exchange_rate', 'balance_from', 'balance_to', 'is_active'),
+    ('created_at', 'trip_id'),
+    "SELECT created_at, trip_id FROM trips WHERE trip_id = ?"
+)
+EXPENSES_PAGE = (
+    """
+    SELECT expense_id, amount_to, amount_from, description, created_at
+    FROM expenses
+    WHERE trip_id = ?
+    """,
+    ('expense_id', 'amount_to', 'amount_from', 'description', 'created_at'),
+    ('created_at', 'expense_id'),
+    "SELECT created_at, expense_id FROM expenses WHERE expense_id = ?"
+)
+
+
+def build_page_query(page: tuple, params: tuple, limit: int,
+                     before: Optional[int] = None, after: Optional[int] = None) -> Tuple[str, list]:
+    """Запрос страницы по ключу курсора: (sql, параметры).
+
+    before — id последней записи предыдущей страницы (листать дальше),
+    after — id первой записи текущей страницы (листать назад). Позиция
+    задаётся значением ключа, а не OFFSET, поэтому любая страница читается
+    одним проходом по индексу. Запрашивается limit + 1 строк, чтобы узнать,
+    есть ли следующая страница.
+    """
+    query, _, key, anchor = page
+    key_sql = f"({', '.join(key)})"
+    args = list(params)
+    if before is not None:
+        query += f" AND {key_sql} < ({anchor})"
+        args.append(before)
+    elif after is not None:
+        query += f" AND {key_sql} > ({anchor})"
+        args.append(after)
+    # Назад листаем по возрастанию ключа и переворачиваем результат
+    order = "ASC" if after is not None else "DESC"
+    query += " ORDER BY " + ", ".join(f"{column} {order}" for column in key) + " LIMIT ?"
+    args.append(limit + 1)
+    return query, args
+
+
+# Частые запросы, которые обязаны идти по индексу (см. check_query_plans);
+# постраничные — во всех трёх вариантах: первая страница, дальше и назад
+HOT_QUERIES = {
+    'get_active_trip': (ACTIVE_TRIP_QUERY, (0,)),
+    'get_all_trips': (ALL_TRIPS_QUERY, (0,)),
+    'get_trip_expenses': (TRIP_EXPENSES_QUERY, (0, 10)),
+    'iter_trip_expenses': (EXPORT_EXPENSES_QUERY, (0,)),
+    'get_trips_page': build_page_query(TRIPS_PAGE, (0,), 10),
+    'get_trips_page(before)': build_page_query(TRIPS_PAGE, (0,), 10, before=0),
+    'get_trips_page(after)': build_page_query(TRIPS_PAGE, (0,), 10, after=0),
+    'get_expenses_page': build_page_query(EXPENSES_PAGE, (0,), 10),
+    'get_expenses_page(before)': build_page_query(EXPENSES_PAGE, (0,), 10, before=0),
+    'get_expenses_page(after)': build_page_query(EXPENSES_PAGE, (0,), 10, after=0),
+    'get_active_trip_daily_spend': (DAILY_SPEND_QUERY, (0, '-7 days')),
+    'get_trip_statistics': (TRIP_STATISTICS_QUERY, (0,)),
+    'get_user_state': (USER_STATE_QUERY, (0, 0.0)),
+}
+
+
+def is_slow_plan(plan: List[str]) -> bool:
+    """План с полным сканированием таблицы или сортировкой во временном B-дереве"""
+    return any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan)
+
 
 class DatabaseManager:
-    def __init__(self, db_name: str = "travel_wallet.db"):
+    def __init__(self, db_name: str = "travel_wallet.db", pool_size: int = 5):
         self.db_name = db_name
+        self.pool = ConnectionPool(db_name, size=pool_size)
+        self.batch_writer = None
         self.init_db()
 
     def get_connection(self):
-        return sqlite3.connect(self.db_name)
+        return self.pool.acquire()
+
+    def release_connection(self, conn):
+        self.pool.release(conn)
+
+    def close(self):
+        """Закрыть все соединения пула"""
+        if self.batch_writer is not None:
+            self.batch_writer.stop()
+        self.pool.close_all()
 
     def init_db(self):
         """Инициализация базы данных с необходимыми таблицами"""
@@ -59,7 +254,12 @@ class DatabaseManager:
         """)
 
         conn.commit()
-        conn.close()
+
+        # Применить миграции схемы (версия хранится в PRAGMA user_version)
+        try:
+            run_migrations(conn)
+        finally:
+            self.release_connection(conn)
 
     def add_user(self, user_id: int, username: str = None):
         """Добавить нового пользователя"""
@@ -72,7 +272,7 @@ class DatabaseManager:
             )
             conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
 
     def create_trip(self, user_id: int, trip_name: str, country_from: str, country_to: str,
                     currency_from: str, currency_to: str, exchange_rate: float,
@@ -100,52 +300,59 @@ class DatabaseManager:
             conn.commit()
             return trip_id
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def _fetch_active_trip(self, cursor, user_id: int):
+        """Прочитать активное путешествие и его статистику одним запросом: (trip, stats)"""
+        cursor.execute(ACTIVE_TRIP_QUERY, (user_id,))
+        
+        row = cursor.fetchone()
+        if not row:
+            return None, None
+        trip = {
+            'trip_id': row[0],
+            'trip_name': row[1],
+            'country_from': row[2],
+            'country_to': row[3],
+            'currency_from': row[4],
+            'currency_to': row[5],
+            'exchange_rate': row[6],
+            'initial_amount_from': row[7],
+            'balance_from': row[8],
+            'balance_to': row[9]
+        }
+        stats = {
+            'total_expenses': row[10],
+            'total_spent_from': row[11],
+            'total_spent_to': row[12]
+        }
+        return trip, stats
 
     def get_active_trip(self, user_id: int) -> Optional[Dict]:
         """Получить активное путешествие пользователя"""
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("""
-                SELECT trip_id, trip_name, country_from, country_to, 
-                       currency_from, currency_to, exchange_rate, 
-                       initial_amount_from, balance_from, balance_to
-                FROM trips 
-                WHERE user_id = ? AND is_active = 1
-            """, (user_id,))
-            
-            row = cursor.fetchone()
-            if row:
-                return {
-                    'trip_id': row[0],
-                    'trip_name': row[1],
-                    'country_from': row[2],
-                    'country_to': row[3],
-                    'currency_from': row[4],
-                    'currency_to': row[5],
-                    'exchange_rate': row[6],
-                    'initial_amount_from': row[7],
-                    'balance_from': row[8],
-                    'balance_to': row[9]
-                }
-            return None
+            trip, _ = self._fetch_active_trip(cursor, user_id)
+            return trip
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def get_active_trip_with_stats(self, user_id: int):
+        """Получить активное путешествие вместе со статистикой: (trip, stats) или (None, None)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            return self._fetch_active_trip(cursor, user_id)
+        finally:
+            self.release_connection(conn)
 
     def get_all_trips(self, user_id: int) -> List[Dict]:
         """Получить все путешествия пользователя"""
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("""
-                SELECT trip_id, trip_name, country_from, country_to, 
-                       currency_from, currency_to, exchange_rate, 
-                       balance_from, balance_to, is_active
-                FROM trips 
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-            """, (user_id,))
+            cursor.execute(ALL_TRIPS_QUERY, (user_id,))
             
             trips = []
             for row in cursor.fetchall():
@@ -163,7 +370,40 @@ class DatabaseManager:
                 })
             return trips
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def _fetch_page(self, page: tuple, params: tuple, limit: int,
+                    before: Optional[int], after: Optional[int]) -> Dict:
+        """Страница списка page (новые записи первыми), см. build_page_query"""
+        query, args = build_page_query(page, params, limit, before, after)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, args)
+            rows = cursor.fetchall()
+        finally:
+            self.release_connection(conn)
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if after is not None:
+            rows.reverse()
+        columns = page[1]
+        return {
+            'items': [dict(zip(columns, row)) for row in rows],
+            'has_prev': more if after is not None else before is not None,
+            'has_next': more if after is None else True
+        }
+
+    def get_trips_page(self, user_id: int, limit: int = 10,
+                       before: int = None, after: int = None) -> Dict:
+        """Страница путешествий пользователя: {'items', 'has_prev', 'has_next'}"""
+        return self._fetch_page(TRIPS_PAGE, (user_id,), limit, before, after)
+
+    def get_expenses_page(self, trip_id: int, limit: int = 15,
+                          before: int = None, after: int = None) -> Dict:
+        """Страница истории расходов путешествия: {'items', 'has_prev', 'has_next'}"""
+        return self._fetch_page(EXPENSES_PAGE, (trip_id,), limit, before, after)
 
     def switch_active_trip(self, user_id: int, trip_id: int) -> bool:
         """Переключить активное путешествие"""
@@ -193,42 +433,84 @@ class DatabaseManager:
             conn.commit()
             return True
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def _insert_expense(self, cursor, trip_id: int, amount_to: float, amount_from: float, description: str):
+        # Добавить запись о расходе
+        cursor.execute("""
+            INSERT INTO expenses (trip_id, amount_to, amount_from, description)
+            VALUES (?, ?, ?, ?)
+        """, (trip_id, amount_to, amount_from, description))
+        
+        # Обновить баланс и накопительную статистику путешествия
+        cursor.execute("""
+            UPDATE trips 
+            SET balance_from = balance_from - ?, balance_to = balance_to - ?,
+                expense_count = expense_count + 1,
+                spent_from = spent_from + ?, spent_to = spent_to + ?
+            WHERE trip_id = ?
+        """, (amount_from, amount_to, amount_from, amount_to, trip_id))
+        
+        # Расходы за текущий день (UTC, как created_at)
+        cursor.execute("""
+            INSERT INTO trip_daily_spend (trip_id, day, spent_from, spent_to, expense_count)
+            VALUES (?, date('now'), ?, ?, 1)
+            ON CONFLICT (trip_id, day) DO UPDATE
+            SET spent_from = spent_from + excluded.spent_from,
+                spent_to = spent_to + excluded.spent_to,
+                expense_count = expense_count + 1
+        """, (trip_id, amount_from, amount_to))
 
     def add_expense(self, trip_id: int, amount_to: float, amount_from: float, description: str = ""):
         """Добавить расход"""
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            # Добавить запись о расходе
-            cursor.execute("""
-                INSERT INTO expenses (trip_id, amount_to, amount_from, description)
-                VALUES (?, ?, ?, ?)
-            """, (trip_id, amount_to, amount_from, description))
-            
-            # Обновить баланс путешествия
-            cursor.execute("""
-                UPDATE trips 
-                SET balance_from = balance_from - ?, balance_to = balance_to - ?
-                WHERE trip_id = ?
-            """, (amount_from, amount_to, trip_id))
-            
+            self._insert_expense(cursor, trip_id, amount_to, amount_from, description)
             conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def record_expense(self, user_id: int, amount_to: float, amount_from: float,
+                       description: str = "") -> Optional[Dict]:
+        """Добавить расход в активное путешествие и вернуть обновлённое путешествие.
+
+        Поиск путешествия, запись расхода и чтение нового баланса выполняются
+        в одной транзакции. Возвращает None, если активного путешествия нет.
+        """
+        if self.batch_writer is not None:
+            return self.batch_writer.submit(user_id, amount_to, amount_from, description).result()
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            trip = self._record_expense(cursor, user_id, amount_to, amount_from, description)
+            conn.commit()
+            return trip
+        finally:
+            self.release_connection(conn)
+
+    def _record_expense(self, cursor, user_id: int, amount_to: float, amount_from: float,
+                        description: str) -> Optional[Dict]:
+        trip, _ = self._fetch_active_trip(cursor, user_id)
+        if not trip:
+            return None
+        self._insert_expense(cursor, trip['trip_id'], amount_to, amount_from, description)
+        trip, _ = self._fetch_active_trip(cursor, user_id)
+        return trip
+
+    def enable_batch_writes(self, max_batch: int = 500, max_delay_ms: float = 20):
+        """Включить групповую запись расходов через отдельный поток-писатель"""
+        if self.batch_writer is None:
+            self.batch_writer = ExpenseBatchWriter(self, max_batch=max_batch, max_delay_ms=max_delay_ms)
 
     def get_trip_expenses(self, trip_id: int, limit: int = 10) -> List[Dict]:
         """Получить историю расходов путешествия"""
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("""
-                SELECT expense_id, amount_to, amount_from, description, created_at
-                FROM expenses
-                WHERE trip_id = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-            """, (trip_id, limit))
+            cursor.execute(TRIP_EXPENSES_QUERY, (trip_id, limit))
             
             expenses = []
             for row in cursor.fetchall():
@@ -241,7 +523,30 @@ class DatabaseManager:
                 })
             return expenses
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    # Столбцы, которые отдаёт iter_trip_expenses
+    EXPORT_COLUMNS = ('expense_id', 'created_at', 'amount_to', 'currency_to',
+                      'amount_from', 'currency_from', 'description')
+
+    def iter_trip_expenses(self, trip_id: int, chunk_size: int = 1000) -> Iterator[List[tuple]]:
+        """Все расходы путешествия пачками по chunk_size строк (столбцы EXPORT_COLUMNS).
+
+        Строки читаются курсором по мере потребления, поэтому память не растёт
+        с числом расходов. Соединение занято, пока генератор не исчерпан или не закрыт.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(EXPORT_EXPENSES_QUERY, (trip_id,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+            self.release_connection(conn)
 
     def update_exchange_rate(self, trip_id: int, new_rate: float) -> bool:
         """Обновить курс обмена для путешествия"""
@@ -272,28 +577,359 @@ class DatabaseManager:
             conn.commit()
             return True
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def get_active_trip_daily_spend(self, user_id: int, days: int = 7):
+        """Активное путешествие, его итоги и расходы по дням за последние days дней.
+
+        Возвращает (trip, stats, daily), где daily — {'started', 'today', 'days'},
+        а days — список (день, spent_from, spent_to, expense_count) по возрастанию.
+        Читается не больше days корзин независимо от числа расходов.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            trip, stats = self._fetch_active_trip(cursor, user_id)
+            if not trip:
+                return None, None, None
+            cursor.execute(
+                "SELECT date(created_at), date('now') FROM trips WHERE trip_id = ?",
+                (trip['trip_id'],)
+            )
+            started, today = cursor.fetchone()
+            cursor.execute(DAILY_SPEND_QUERY, (trip['trip_id'], f"-{int(days)} days"))
+            daily = {'started': started, 'today': today, 'days': cursor.fetchall()}
+            return trip, stats, daily
+        finally:
+            self.release_connection(conn)
 
     def get_trip_statistics(self, trip_id: int) -> Dict:
-        """Получить статистику по путешествию"""
+        """Получить статистику по путешествию (накопительные итоги из trips)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_expenses,
-                    COALESCE(SUM(amount_from), 0) as total_spent_from,
-                    COALESCE(SUM(amount_to), 0) as total_spent_to
-                FROM expenses
-                WHERE trip_id = ?
-            """, (trip_id,))
+            cursor.execute(TRIP_STATISTICS_QUERY, (trip_id,))
             
-            row = cursor.fetchone()
+            row = cursor.fetchone() or (0, 0, 0)
             return {
                 'total_expenses': row[0],
                 'total_spent_from': row[1],
                 'total_spent_to': row[2]
             }
+        finally:
+            self.release_connection(conn)
+
+    def reconcile_trip_statistics(self, fix: bool = False) -> List[Dict]:
+        """Пересчитать итоги по expenses и найти расхождения с накопительной статистикой.
+
+        При fix=True расхождения исправляются. Возвращает список расхождений.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if fix:
+                # Пересчёт и исправление — одна транзакция записи: расход, добавленный
+                # между ними, иначе был бы затёрт устаревшими итогами
+                cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                SELECT t.trip_id, t.expense_count, t.spent_from, t.spent_to,
+                       COUNT(e.expense_id), COALESCE(SUM(e.amount_from), 0), COALESCE(SUM(e.amount_to), 0)
+                FROM trips t
+                LEFT JOIN expenses e ON e.trip_id = t.trip_id
+                GROUP BY t.trip_id
+            """)
+            
+            drift = []
+            for row in cursor.fetchall():
+                if (row[1] != row[4] or abs(row[2] - row[5]) > 1e-6
+                        or abs(row[3] - row[6]) > 1e-6):
+                    drift.append({
+                        'trip_id': row[0],
+                        'stored': {'total_expenses': row[1], 'total_spent_from': row[2], 'total_spent_to': row[3]},
+                        'actual': {'total_expenses': row[4], 'total_spent_from': row[5], 'total_spent_to': row[6]}
+                    })
+            
+            if fix and drift:
+                cursor.executemany("""
+                    UPDATE trips
+                    SET expense_count = ?, spent_from = ?, spent_to = ?
+                    WHERE trip_id = ?
+                """, [(d['actual']['total_expenses'], d['actual']['total_spent_from'],
+                       d['actual']['total_spent_to'], d['trip_id']) for d in drift])
+            if fix:
+                conn.commit()
+            return drift
+        finally:
+            self.release_connection(conn)
+
+    def get_used_currencies(self) -> List[str]:
+        """Получить все валюты, которые используются в путешествиях"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT currency_from FROM trips
+                UNION
+                SELECT currency_to FROM trips
+            """)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+
+    def get_active_currency_usage(self) -> Dict[str, int]:
+        """Число активных путешествий по каждой валюте, самые частые первыми"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT currency, COUNT(*) AS trips
+                FROM (
+                    SELECT currency_from AS currency FROM trips WHERE is_active = 1
+                    UNION ALL
+                    SELECT currency_to FROM trips WHERE is_active = 1
+                )
+                GROUP BY currency
+                ORDER BY trips DESC, currency
+            """)
+            return {row[0]: row[1] for row in cursor.fetchall()}
+        finally:
+            self.release_connection(conn)
+
+    def get_user_state(self, user_id: int, now: float) -> Optional[str]:
+        """Состояние диалога пользователя (JSON), если оно ещё не истекло"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(USER_STATE_QUERY, (user_id, now))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            self.release_connection(conn)
+
+    def set_user_state(self, user_id: int, data: str, expires_at: float, purge_before: float = None):
+        """Сохранить состояние диалога; purge_before — заодно удалить истёкшие до этого момента"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT OR REPLACE INTO user_states (user_id, data, expires_at) VALUES (?, ?, ?)",
+                (user_id, data, expires_at)
+            )
+            if purge_before is not None:
+                cursor.execute("DELETE FROM user_states WHERE expires_at <= ?", (purge_before,))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+
+    def delete_user_state(self, user_id: int):
+        """Удалить состояние диалога пользователя"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM user_states WHERE user_id = ?", (user_id,))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+
+    def count_user_states(self, now: float) -> int:
+        """Число неистёкших состояний диалогов"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM user_states WHERE expires_at > ?", (now,))
+            return cursor.fetchone()[0]
+        finally:
+            self.release_connection(conn)
+
+    def check_query_plans(self) -> Dict[str, List[str]]:
+        """Проверить планы частых запросов (EXPLAIN QUERY PLAN).
+
+        Возвращает запросы, которые выполняются полным сканированием таблицы
+        или сортировкой во временном B-дереве, с их планами.
+        """
+        problems = {}
+        for name, (query, params) in HOT_QUERIES.items():
+            plan = self.explain_query_plan(query, params)
+            if is_slow_plan(plan):
+                problems[name] = plan
+        return problems
+
+    def explain_query_plan(self, query: str, params=()) -> List[str]:
+        """Шаги плана запроса (EXPLAIN QUERY PLAN)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+            return [row[3] for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+
+class ExpenseBatchWriter:
+    """Групповая запись расходов (write-behind).
+
+    Запросы на запись складываются в очередь, единственный поток-писатель
+    забирает их пачками (до max_batch штук или max_delay_ms ожидания)
+    и фиксирует одной транзакцией, так что один fsync приходится на всю
+    пачку. У писателя своё соединение с synchronous=FULL (у соединений пула
+    NORMAL, и в режиме WAL commit без fsync может пропасть при отключении
+    питания). Future каждого запроса завершается только после commit,
+    поэтому подтверждение пользователь получает, когда данные уже на диске.
+    """
+
+    def __init__(self, db: DatabaseManager, max_batch: int = 500, max_delay_ms: float = 20):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="expense-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, user_id: int, amount_to: float, amount_from: float, description: str = "") -> Future:
+        """Поставить расход в очередь; Future вернёт обновлённое путешествие или None"""
+        future = Future()
+        self.queue.put((future, (user_id, amount_to, amount_from, description)))
+        return future
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        conn = self.db.pool._connect(synchronous="FULL")
+        try:
+            self._loop(conn)
         finally:
             conn.close()
 
+    def _loop(self, conn: sqlite3.Connection):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(conn, batch)
+            if stop:
+                return
+
+    def _flush(self, conn: sqlite3.Connection, batch):
+        cursor = conn.cursor()
+        results = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for future, args in batch:
+                # Ошибка одной записи не должна откатывать всю пачку
+                cursor.execute("SAVEPOINT expense")
+                try:
+                    results.append((future, self.db._record_expense(cursor, *args), None))
+                    cursor.execute("RELEASE expense")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO expense")
+                    cursor.execute("RELEASE expense")
+                    results.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class AsyncDatabaseManager:
+    """Асинхронная обёртка над DatabaseManager.
+
+    Каждый метод DatabaseManager доступен как корутина и выполняется в пуле
+    потоков, не блокируя event loop бота.
+    """
+
+    def __init__(self, db: DatabaseManager, max_workers: int = 4):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        # Вызовы, которые ждут свободного потока или выполняются (для метрик)
+        self.inflight = 0
+
+    async def record_expense(self, user_id: int, amount_to: float, amount_from: float,
+                             description: str = "") -> Optional[Dict]:
+        # При групповой записи ждать commit, не занимая поток из пула
+        if self.db.batch_writer is not None:
+            with DB_LATENCY.time('record_expense'):
+                future = self.db.batch_writer.submit(user_id, amount_to, amount_from, description)
+                return await asyncio.wrap_future(future)
+        return await self.__getattr__('record_expense')(user_id, amount_to, amount_from, description)
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+
+        def timed(*args, **kwargs):
+            # Время самого запроса в потоке пула, без ожидания свободного потока
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                DB_LATENCY.observe(time.perf_counter() - started, name)
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            self.inflight += 1
+            try:
+                return await loop.run_in_executor(self.executor, functools.partial(timed, *args, **kwargs))
+            finally:
+                self.inflight -= 1
+
+        return wrapper
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных Travel Wallet")
+    parser.add_argument("--db", default="travel_wallet.db", help="путь к файлу базы данных")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("check-plans", help="проверить, что частые запросы используют индексы")
+    reconcile_parser = commands.add_parser("reconcile", help="сверить статистику путешествий с расходами")
+    reconcile_parser.add_argument("--fix", action="store_true", help="исправить найденные расхождения")
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db)
+
+    if args.command == "reconcile":
+        drift = db.reconcile_trip_statistics(fix=args.fix)
+        for item in drift:
+            print(f"❌ Путешествие {item['trip_id']}: сохранено {item['stored']}, по расходам {item['actual']}")
+        if not drift:
+            print("✅ Статистика путешествий совпадает с расходами")
+        elif args.fix:
+            print(f"🔧 Исправлено путешествий: {len(drift)}")
+        else:
+            sys.exit(1)
+    else:
+        problems = db.check_query_plans()
+        for name, plan in problems.items():
+            print(f"❌ {name}: " + "; ".join(plan))
+        if problems:
+            sys.exit(1)
+        print("✅ Все частые запросы используют индексы")
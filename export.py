@@ -0,0 +1,83 @@
+"""Выгрузка полной истории расходов путешествия в файл.
+
+Расходы читаются из базы пачками и сразу дописываются в файл, поэтому
+потребление памяти не зависит от размера истории. CSV доступен всегда,
+Parquet — если установлен pyarrow.
+"""
+import csv
+import os
+
+from database import DatabaseManager
+
+EXPORT_FORMATS = ("csv", "parquet")
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+
+
+def write_csv(db: DatabaseManager, trip_id: int, path: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Записать расходы в CSV; возвращает число строк"""
+    count = 0
+    # utf-8-sig: Excel правильно открывает кириллицу в описаниях
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(DatabaseManager.EXPORT_COLUMNS)
+        for rows in db.iter_trip_expenses(trip_id, chunk_size):
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def write_parquet(db: DatabaseManager, trip_id: int, path: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Записать расходы в Parquet, по группе строк на пачку; возвращает число строк"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet установите pyarrow")
+
+    schema = pa.schema([
+        ('expense_id', pa.int64()),
+        ('created_at', pa.string()),
+        ('amount_to', pa.float64()),
+        ('currency_to', pa.string()),
+        ('amount_from', pa.float64()),
+        ('currency_from', pa.string()),
+        ('description', pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in db.iter_trip_expenses(trip_id, chunk_size):
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            count += len(rows)
+    return count
+
+
+def export_trip(db: DatabaseManager, trip_id: int, path: str, fmt: str = "csv") -> int:
+    """Выгрузить расходы путешествия в файл нужного формата"""
+    if fmt == "parquet":
+        return write_parquet(db, trip_id, path)
+    if fmt == "csv":
+        return write_csv(db, trip_id, path)
+    raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Выгрузка истории расходов путешествия")
+    parser.add_argument("trip_id", type=int, help="ID путешествия")
+    parser.add_argument("--db", default="travel_wallet.db", help="путь к файлу базы данных")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="формат файла")
+    parser.add_argument("-o", "--output", help="путь к файлу (по умолчанию trip_<ID>.<формат>)")
+    args = parser.parse_args()
+
+    output = args.output or f"trip_{args.trip_id}.{args.format}"
+    db = DatabaseManager(args.db)
+    try:
+        count = export_trip(db, args.trip_id, output, args.format)
+    finally:
+        db.close()
+    print(f"✅ Выгружено расходов: {count} → {output}")
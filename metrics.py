@@ -0,0 +1,198 @@
+"""Метрики в текстовом формате Prometheus и эндпоинт /metrics.
+
+Гистограммы считаются на месте: наблюдение — это perf_counter, поиск
+корзины (bisect) и пара сложений под блокировкой, поэтому инструментацию
+можно не выключать в продакшене. Счётчики и глубины очередей, которые уже
+хранятся в объектах бота, не дублируются: они читаются функциями-сборщиками
+только в момент запроса /metrics.
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple, Union
+
+from aiohttp import web
+
+# Адрес эндпоинта /metrics; порт 0 отключает его
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+
+# Границы корзин в секундах: от быстрых запросов к SQLite до медленного API
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Гистограмма длительностей с метками"""
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self.children: Dict[Tuple, list] = {}
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            child = self.children.get(labels)
+            if child is None:
+                child = self.children[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            child[0][index] += 1
+            child[1] += value
+
+    def time(self, *labels) -> "Timer":
+        """Контекстный менеджер: записать длительность блока"""
+        return Timer(self, labels)
+
+    def timed(self, *labels):
+        """Декоратор корутины: записать длительность каждого вызова"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *labels)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            children = [(labels, list(counts), total) for labels, (counts, total) in self.children.items()]
+        for labels, counts, total in sorted(children):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Collected:
+    """Счётчик или gauge, значение которого читается при запросе /metrics.
+
+    collect возвращает число либо словарь {значения меток: число}.
+    """
+
+    def __init__(self, name: str, description: str, collect: Callable[[], Union[float, Dict[Tuple, float]]],
+                 labels: Tuple[str, ...] = (), kind: str = "gauge"):
+        self.name = name
+        self.description = description
+        self.collect = collect
+        self.labels = labels
+        self.kind = kind
+        _metrics.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+def gauge(name: str, description: str, labels: Tuple[str, ...] = ()):
+    """Зарегистрировать gauge, значение которого вычисляет декорируемая функция"""
+    def decorator(collect):
+        Collected(name, description, collect, labels)
+        return collect
+    return decorator
+
+
+def counter(name: str, description: str, labels: Tuple[str, ...] = ()):
+    """Зарегистрировать счётчик, значение которого вычисляет декорируемая функция"""
+    def decorator(collect):
+        Collected(name, description, collect, labels, kind="counter")
+        return collect
+    return decorator
+
+
+def render_metrics() -> str:
+    """Все метрики процесса в текстовом формате Prometheus"""
+    lines = []
+    for metric in _metrics:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            print(f"⚠️ Ошибка сбора метрики {metric.name}: {e}")
+    return "\n".join(lines) + "\n"
+
+
+# Метрики горячих путей
+HANDLER_LATENCY = Histogram(
+    "travel_wallet_handler_seconds", "Время обработки обновления", ("kind", "name")
+)
+DB_LATENCY = Histogram(
+    "travel_wallet_db_seconds", "Время выполнения метода DatabaseManager", ("method",)
+)
+UPSTREAM_LATENCY = Histogram(
+    "travel_wallet_upstream_seconds", "Время запроса к API курсов по статусу ответа", ("endpoint", "status")
+)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Запустить HTTP-сервер с /metrics; возвращает runner для остановки или None"""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        await runner.cleanup()
+        print(f"⚠️ Не удалось открыть /metrics на {host}:{port}: {e}")
+        return None
+    print(f"📈 Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,163 @@
+import sqlite3
+from typing import Callable, List, Tuple
+
+
+# Размер пачки при заполнении больших таблиц
+BACKFILL_BATCH_SIZE = 5000
+
+# Зарегистрированные миграции: (версия, описание, функция)
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str):
+    """Зарегистрировать шаг миграции схемы с указанным номером версии"""
+    def decorator(func):
+        if any(existing[0] == version for existing in MIGRATIONS):
+            raise ValueError(f"Миграция {version} уже зарегистрирована")
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return decorator
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """Применить все миграции новее PRAGMA user_version.
+
+    Каждый шаг выполняется в отдельной транзакции вместе с повышением версии,
+    поэтому при ошибке база остаётся на предыдущей версии.
+    """
+    current = get_schema_version(conn)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        # Другой процесс мог применить миграцию, пока мы ждали блокировку
+        if get_schema_version(conn) >= version:
+            conn.rollback()
+            current = version
+            continue
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"🗄 Применена миграция {version}: {description}")
+        current = version
+    return current
+
+
+def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    """Добавить колонку, если её ещё нет (шаг можно безопасно повторить)"""
+    if not column_exists(conn, table, column):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def backfill(conn: sqlite3.Connection, table: str, update_sql: str, batch_size: int = BACKFILL_BATCH_SIZE):
+    """Заполнить таблицу пачками по диапазонам rowid.
+
+    update_sql получает параметры :start и :end (start < rowid <= end).
+    Каждая пачка фиксируется отдельно, чтобы не держать блокировку записи
+    на всё время заполнения; шаг должен быть идемпотентным, так как после
+    сбоя миграция начнётся заново.
+    """
+    max_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+    start = 0
+    while start < max_rowid:
+        end = start + batch_size
+        conn.execute(update_sql, {'start': start, 'end': end})
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        start = end
+
+
+@migration(1, "индексы для частых запросов")
+def add_hot_query_indexes(conn: sqlite3.Connection):
+    # Активное путешествие, список путешествий, история расходов
+    # и статистика (покрывающий индекс для SUM)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trips_user_active
+        ON trips (user_id, is_active)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trips_user_created
+        ON trips (user_id, created_at)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_expenses_trip_created
+        ON expenses (trip_id, created_at, amount_from, amount_to)
+    """)
+
+
+@migration(2, "накопительная статистика расходов в trips")
+def add_trip_totals(conn: sqlite3.Connection):
+    add_column(conn, "trips", "expense_count", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "trips", "spent_from", "REAL NOT NULL DEFAULT 0")
+    add_column(conn, "trips", "spent_to", "REAL NOT NULL DEFAULT 0")
+    backfill(conn, "trips", """
+        UPDATE trips
+        SET expense_count = (SELECT COUNT(*) FROM expenses e WHERE e.trip_id = trips.trip_id),
+            spent_from = (SELECT COALESCE(SUM(amount_from), 0) FROM expenses e WHERE e.trip_id = trips.trip_id),
+            spent_to = (SELECT COALESCE(SUM(amount_to), 0) FROM expenses e WHERE e.trip_id = trips.trip_id)
+        WHERE rowid > :start AND rowid <= :end
+    """)
+
+
+@migration(3, "таблица состояний диалогов")
+def add_user_states(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_states (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_states_expires
+        ON user_states (expires_at)
+    """)
+
+
+@migration(4, "индекс для постраничной истории расходов")
+def add_expense_page_index(conn: sqlite3.Connection):
+    # Курсор страницы — (created_at, expense_id): индекс отдаёт страницу
+    # без сортировки при любой глубине листания
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_expenses_trip_page
+        ON expenses (trip_id, created_at, expense_id)
+    """)
+    # Индекс миграции 1 покрывал SUM по расходам, которых больше нет (итоги хранятся
+    # в trips); история и выгрузка идут по idx_expenses_trip_page
+    conn.execute("DROP INDEX IF EXISTS idx_expenses_trip_created")
+
+
+@migration(5, "расходы путешествий по дням")
+def add_trip_daily_spend(conn: sqlite3.Connection):
+    # Корзина на каждый день путешествия: статистика за последние дни
+    # читается по первичному ключу, без просмотра expenses
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS trip_daily_spend (
+            trip_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            spent_from REAL NOT NULL DEFAULT 0,
+            spent_to REAL NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (trip_id, day)
+        ) WITHOUT ROWID
+    """)
+    backfill(conn, "trips", """
+        INSERT OR REPLACE INTO trip_daily_spend (trip_id, day, spent_from, spent_to, expense_count)
+        SELECT trip_id, date(created_at), SUM(amount_from), SUM(amount_to), COUNT(*)
+        FROM expenses
+        WHERE trip_id > :start AND trip_id <= :end
+        GROUP BY trip_id, date(created_at)
+    """)
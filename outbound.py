@@ -0,0 +1,175 @@
+"""Исходящие сообщения бота: лимиты частоты, повтор при 429 и «⏳»-заглушки.
+
+Telegram ограничивает частоту отправки и в целом для бота, и для каждого
+чата; при превышении отвечает 429 с retry_after. ThrottledTeleBot
+распределяет отправки по корзинам токенов (очередь FIFO по времени
+резервирования) и повторяет запрос после retry_after.
+
+Заглушка «⏳ ...» (send_placeholder) отправляется, только если ответ
+задерживается дольше PLACEHOLDER_DELAY. Если ответ успел раньше, заглушка
+не отправляется вовсе, а если она уже видна — ответ заменяет её текст
+одним редактированием вместо второго сообщения.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+
+# Сообщений в секунду для всего бота и для одного чата (с запасом на всплеск)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", 3))
+# Сколько раз повторять запрос после ответа 429
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+# Через сколько секунд заглушка всё-таки отправляется и сколько она может ждать ответа
+PLACEHOLDER_DELAY = float(os.getenv("PLACEHOLDER_DELAY", 0.5))
+PLACEHOLDER_TTL = 60
+
+# Сколько корзин чатов держать в памяти
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Корзина токенов: rate отправок в секунду, запас burst"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Занять токен; вернуть, сколько секунд ждать до отправки.
+
+        Токены могут уйти в минус — это очередь уже зарезервированных отправок,
+        поэтому порядок вызовов сохраняется.
+        """
+        now = time.monotonic()
+        self.tokens = self.level(now)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def level(self, now: float = None) -> float:
+        """Токены на момент now с учётом пополнения; минус — ещё не наступившие отправки"""
+        now = time.monotonic() if now is None else now
+        return min(self.burst, self.tokens + (now - self.updated) * self.rate)
+
+
+class Placeholder:
+    """Отложенная заглушка «⏳» одного чата"""
+
+    def __init__(self):
+        self.created = time.monotonic()
+        self.sending = False
+        self.message = None
+        self.task = None
+
+
+class ThrottledTeleBot(AsyncTeleBot):
+    """AsyncTeleBot с лимитами отправки, повтором при 429 и объединением заглушек"""
+
+    def __init__(self, token: str, *args, global_rate: float = SEND_GLOBAL_RATE,
+                 chat_rate: float = SEND_CHAT_RATE, chat_burst: int = SEND_CHAT_BURST,
+                 max_retries: int = SEND_MAX_RETRIES, placeholder_delay: float = PLACEHOLDER_DELAY, **kwargs):
+        super().__init__(token, *args, **kwargs)
+        self.set_global_rate(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = OrderedDict()
+        self.max_retries = max_retries
+        self.placeholder_delay = placeholder_delay
+        self.placeholders = {}
+        self.retries_429 = 0
+        self.placeholders_skipped = 0
+
+    def set_global_rate(self, rate: float):
+        """Задать общий лимит отправки бота (например, долю лимита для воркера webhook)"""
+        self.global_bucket = TokenBucket(rate, max(1, int(rate)))
+
+    def pending_sends(self) -> int:
+        """Сколько отправок ждут своей очереди в общей корзине"""
+        return max(0, math.ceil(-self.global_bucket.level()))
+
+    async def _throttle(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            # Самые давние корзины давно полны — их можно забыть
+            while len(self.chat_buckets) > MAX_CHAT_BUCKETS:
+                self.chat_buckets.popitem(last=False)
+        else:
+            self.chat_buckets.move_to_end(chat_id)
+        delay = max(bucket.reserve(), self.global_bucket.reserve())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _call(self, chat_id, method, *args, **kwargs):
+        """Вызвать метод API с учётом лимитов; на 429 подождать retry_after и повторить"""
+        for attempt in range(self.max_retries + 1):
+            await self._throttle(chat_id)
+            try:
+                return await method(*args, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == self.max_retries:
+                    raise
+                retry_after = ((e.result_json or {}).get('parameters') or {}).get('retry_after', 1)
+                self.retries_429 += 1
+                print(f"⏳ Лимит Telegram для чата {chat_id}, повтор через {retry_after} с")
+                await asyncio.sleep(retry_after)
+
+    async def send_placeholder(self, chat_id, text: str):
+        """Показать «подождите», если следующий ответ в этот чат задержится"""
+        await self._take_placeholder(chat_id)
+        placeholder = Placeholder()
+        placeholder.task = asyncio.create_task(self._send_placeholder_later(chat_id, text, placeholder))
+        self.placeholders[chat_id] = placeholder
+
+    async def _send_placeholder_later(self, chat_id, text: str, placeholder: Placeholder):
+        await asyncio.sleep(self.placeholder_delay)
+        placeholder.sending = True
+        placeholder.message = await self._call(chat_id, super().send_message, chat_id, text)
+
+    async def _take_placeholder(self, chat_id):
+        """Забрать заглушку чата: её сообщение, если она уже отправлена, иначе None"""
+        placeholder = self.placeholders.pop(chat_id, None)
+        if placeholder is None:
+            return None
+        if not placeholder.sending:
+            # Ответ успел раньше — заглушка не нужна
+            placeholder.task.cancel()
+            self.placeholders_skipped += 1
+            return None
+        try:
+            await placeholder.task
+        except Exception:
+            return None
+        if time.monotonic() - placeholder.created > PLACEHOLDER_TTL:
+            return None
+        return placeholder.message
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        message = await self._take_placeholder(chat_id)
+        markup = kwargs.get('reply_markup')
+        # Отредактировать уже видимую заглушку, если ответ можно показать правкой
+        if (message is not None and not args and set(kwargs) <= {'reply_markup', 'parse_mode'}
+                and (markup is None or isinstance(markup, (str, types.InlineKeyboardMarkup)))):
+            try:
+                return await self._call(
+                    chat_id, super().edit_message_text, text, chat_id, message.message_id, **kwargs
+                )
+            except ApiTelegramException:
+                pass
+        return await self._call(chat_id, super().send_message, chat_id, text, *args, **kwargs)
+
+    async def edit_message_text(self, text=None, chat_id=None, *args, **kwargs):
+        return await self._call(chat_id, super().edit_message_text, text, chat_id, *args, **kwargs)
+
+    async def send_document(self, chat_id, document, *args, **kwargs):
+        await self._take_placeholder(chat_id)
+        return await self._call(chat_id, super().send_document, chat_id, document, *args, **kwargs)
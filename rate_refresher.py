@@ -0,0 +1,174 @@
+"""Фоновое обновление таблицы курсов.
+
+Обработчики читают курсы только из памяти (RateTable), а эта задача по
+расписанию обновляет их пачками: сначала валюты, которые используют больше
+всего активных путешествий, затем остальные отслеживаемые. Число запросов
+к API ограничено суточным бюджетом.
+
+В режиме webhook курсы из API загружает только один воркер и сохраняет их
+в снимок на диске; остальные подхватывают снимок через SnapshotWatcher.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from current_api import RateTable
+from rate_snapshot import SNAPSHOT_PATH
+
+# Интервал обновления в секундах и разброс (доля интервала)
+RATE_REFRESH_INTERVAL = int(os.getenv("RATE_REFRESH_INTERVAL", 900))
+RATE_REFRESH_JITTER = float(os.getenv("RATE_REFRESH_JITTER", 0.1))
+# Сколько валют запрашивать в одном обращении к /live
+RATE_REFRESH_BATCH = int(os.getenv("RATE_REFRESH_BATCH", 50))
+# Сколько запросов к API можно потратить на обновление за сутки
+RATE_REFRESH_DAILY_QUOTA = int(os.getenv("RATE_REFRESH_DAILY_QUOTA", 200))
+# Внеочередное обновление не чаще, чем раз в столько секунд после предыдущего
+RATE_REFRESH_MIN_INTERVAL = float(os.getenv("RATE_REFRESH_MIN_INTERVAL", 300))
+# Как часто воркеры webhook проверяют, не обновился ли снимок курсов (секунды)
+RATE_SNAPSHOT_POLL = float(os.getenv("RATE_SNAPSHOT_POLL", 30))
+
+
+class QuotaBudget:
+    """Скользящий бюджет запросов: не больше limit за period секунд"""
+
+    def __init__(self, limit: int, period: float = 86400):
+        self.limit = limit
+        self.period = period
+        self.calls = deque()
+
+    def available(self) -> int:
+        now = time.time()
+        while self.calls and self.calls[0] <= now - self.period:
+            self.calls.popleft()
+        return max(0, self.limit - len(self.calls))
+
+    def spend(self):
+        self.calls.append(time.time())
+
+
+class RateRefresher:
+    """Периодически обновляет RateTable пачками по приоритету валют"""
+
+    def __init__(self, rate_table: RateTable,
+                 load_usage: Callable[[], Awaitable[Dict[str, int]]],
+                 on_refresh: Optional[Callable[[], Awaitable]] = None,
+                 interval: float = RATE_REFRESH_INTERVAL, jitter: float = RATE_REFRESH_JITTER,
+                 batch_size: int = RATE_REFRESH_BATCH, daily_quota: int = RATE_REFRESH_DAILY_QUOTA,
+                 min_interval: float = RATE_REFRESH_MIN_INTERVAL):
+        self.rate_table = rate_table
+        self.load_usage = load_usage
+        self.on_refresh = on_refresh
+        self.interval = interval
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.budget = QuotaBudget(daily_quota)
+        self.min_interval = min_interval
+        # Когда закончился последний цикл обновления (удачный или нет)
+        self.refreshed_at = 0.0
+        self.pending = None
+
+    def next_delay(self) -> float:
+        """Интервал со случайным разбросом, чтобы процессы не обращались к API одновременно"""
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def prioritize(self, usage: Dict[str, int]) -> List[str]:
+        """Валюты по убыванию числа активных путешествий, затем остальные отслеживаемые"""
+        ordered = [code for code, _ in sorted(usage.items(), key=lambda item: (-item[1], item[0]))]
+        self.rate_table.track(*ordered)
+        with self.rate_table.lock:
+            rest = sorted(self.rate_table.tracked - set(ordered))
+        return [code for code in ordered + rest if code != self.rate_table.base]
+
+    async def refresh_once(self) -> int:
+        """Один цикл обновления; возвращает число успешно обновлённых пачек"""
+        currencies = self.prioritize(await self.load_usage())
+        batches = [currencies[i:i + self.batch_size] for i in range(0, len(currencies), self.batch_size)]
+        allowed = self.budget.available()
+        if allowed < len(batches):
+            print(f"⚠️ Бюджет запросов курсов: обновляются {allowed} из {len(batches)} пачек")
+
+        refreshed = failed = 0
+        for batch in batches:
+            # Бюджет тратит только запрос, который действительно ушёл в API:
+            # ожидание такого же запроса в полёте квоту не расходует
+            if not self.budget.available():
+                break
+            try:
+                # В обход кэша ответов: просроченный ответ из кэша отставал бы на цикл
+                ok = await self.rate_table.async_refresh(batch, revalidate=True, on_request=self.budget.spend)
+            except Exception as e:
+                print(f"⚠️ Ошибка обновления пачки курсов {batch[0]}…{batch[-1]}: {e}")
+                ok = False
+            # Неудачная пачка не останавливает цикл: остальные валюты обновляются
+            if ok:
+                refreshed += 1
+            else:
+                failed += 1
+        self.refreshed_at = time.time()
+        if failed:
+            print(f"⚠️ Не обновлено пачек курсов: {failed} из {len(batches)}")
+        if refreshed and self.on_refresh:
+            await self.on_refresh()
+        return refreshed
+
+    async def refresh_now(self, currencies: list = None) -> int:
+        """Внеочередное обновление (например, для новой пары валют).
+
+        Идёт теми же пачками и из того же бюджета, что и плановое;
+        одновременные вызовы ждут одно общее обновление. Если предыдущее
+        закончилось меньше min_interval секунд назад, а валюты currencies
+        уже есть в таблице, возвращает 0 без запросов: поставщик, который
+        обновляет котировки реже, чем их считают устаревшими, новее не даст.
+        """
+        if self.pending is None or self.pending.done():
+            recent = time.time() - self.refreshed_at < self.min_interval
+            if recent and self.rate_table.has(*(currencies or ())):
+                return 0
+            self.pending = asyncio.ensure_future(self.refresh_once())
+        return await asyncio.shield(self.pending)
+
+    async def run(self):
+        """Бесконечный цикл обновления (запускается фоновой задачей)"""
+        while True:
+            await asyncio.sleep(self.next_delay())
+            try:
+                await self.refresh_once()
+            except Exception as e:
+                print(f"⚠️ Ошибка фонового обновления курсов: {e}")
+
+
+class SnapshotWatcher:
+    """Следит за снимком курсов, который сохраняет другой процесс"""
+
+    def __init__(self, on_change: Callable[[], Awaitable], path: str = SNAPSHOT_PATH,
+                 interval: float = RATE_SNAPSHOT_POLL):
+        self.on_change = on_change
+        self.path = path
+        self.interval = interval
+        self.mtime = None
+
+    def changed(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        return True
+
+    async def run(self):
+        """Бесконечный цикл проверки снимка (запускается фоновой задачей).
+
+        Первая проверка всегда загружает снимок: он мог обновиться после старта.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.changed():
+                    await self.on_change()
+            except Exception as e:
+                print(f"⚠️ Ошибка загрузки снимка курсов: {e}")
@@ -0,0 +1,83 @@
+"""Снимок справочника валют и таблицы курсов на диске.
+
+Формат двоичный и компактный: заголовок, коды валют по 3 байта, курсы
+массивом double и список названий валют. Загрузка — одно чтение файла
+без разбора JSON, поэтому бот стартует с известными курсами даже без сети.
+"""
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, Optional
+
+SNAPSHOT_PATH = os.getenv("RATE_SNAPSHOT_PATH", "rates.snapshot")
+
+# Сигнатура, время снимка, число курсов, длина блока названий валют
+_HEADER = struct.Struct("<4sdII")
+_MAGIC = b"RTS1"
+_CODE_SIZE = 3
+
+
+def save_snapshot(base: str, rates: Dict[str, float], updated_at: float,
+                  currencies: Dict[str, str] = None, path: str = SNAPSHOT_PATH):
+    """Записать снимок атомарно: во временный файл, затем переименование.
+
+    Базовая валюта записывается первой.
+    """
+    codes = [base] + sorted(code for code in rates if code != base and len(code) == _CODE_SIZE)
+    values = array("d", (rates.get(code, 1.0) for code in codes))
+    if sys.byteorder != "little":
+        values.byteswap()
+    names = "".join(f"{code}\t{name}\n" for code, name in sorted((currencies or {}).items()))
+    names = names.encode("utf-8")
+
+    # У каждого процесса свой временный файл: воркеры webhook пишут снимок независимо
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, updated_at, len(codes), len(names)))
+        f.write("".join(codes).encode("ascii"))
+        f.write(values.tobytes())
+        f.write(names)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Optional[Dict]:
+    """Прочитать снимок: {'base', 'rates', 'updated_at', 'currencies'} или None"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        magic, updated_at, count, names_size = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            return None
+        offset = _HEADER.size
+        codes_blob = data[offset:offset + count * _CODE_SIZE].decode("ascii")
+        offset += count * _CODE_SIZE
+        values = array("d")
+        values.frombytes(data[offset:offset + count * values.itemsize])
+        if sys.byteorder != "little":
+            values.byteswap()
+        offset += count * values.itemsize
+        names = data[offset:offset + names_size].decode("utf-8")
+    except (struct.error, UnicodeDecodeError, ValueError):
+        return None
+
+    codes = [codes_blob[i:i + _CODE_SIZE] for i in range(0, len(codes_blob), _CODE_SIZE)]
+    if not codes or len(codes) != len(values):
+        return None
+    currencies = dict(line.split("\t", 1) for line in names.splitlines() if "\t" in line)
+    return {
+        'base': codes[0],
+        'rates': dict(zip(codes, values)),
+        'updated_at': updated_at,
+        'currencies': currencies,
+    }
+
+
+def snapshot_age(snapshot: Dict) -> float:
+    """Возраст снимка в секундах"""
+    return time.time() - snapshot['updated_at']
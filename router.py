@@ -0,0 +1,38 @@
+from typing import Callable, Dict, Optional, Tuple
+
+
+class Router:
+    """Таблица диспетчеризации: обработчик находится по ключу за O(1).
+
+    Используется для callback-кнопок (ключ — действие из callback_data)
+    и для шагов диалога (ключ — состояние пользователя).
+    """
+
+    def __init__(self, separator: str = "_"):
+        self.separator = separator
+        self.handlers: Dict[str, Callable] = {}
+
+    def route(self, key: str):
+        """Зарегистрировать обработчик для ключа"""
+        def decorator(func):
+            if key in self.handlers:
+                raise ValueError(f"Обработчик для '{key}' уже зарегистрирован")
+            self.handlers[key] = func
+            return func
+        return decorator
+
+    def get(self, key: Optional[str]) -> Optional[Callable]:
+        return self.handlers.get(key)
+
+    def parse_callback(self, data: str) -> Tuple[Optional[str], tuple]:
+        """Разобрать callback_data в (действие, аргументы).
+
+        Сначала ищется точное совпадение ("menu_balance"), затем действие
+        с аргументом после последнего разделителя ("switch_trip_42").
+        """
+        if data in self.handlers:
+            return data, ()
+        action, _, arg = data.rpartition(self.separator)
+        if action in self.handlers:
+            return action, (arg,)
+        return None, ()
@@ -0,0 +1,98 @@
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+# Через сколько секунд бездействия состояние диалога удаляется
+STATE_TTL = int(os.getenv("STATE_TTL", 86400))
+# Максимальное число пользователей в памяти
+STATE_MAX_USERS = int(os.getenv("STATE_MAX_USERS", 100000))
+
+
+class MemoryStateStore:
+    """Хранилище состояний диалогов в памяти с TTL и вытеснением LRU.
+
+    Методы — корутины, как у SQLite-хранилища, но выполняются сразу, без
+    ожидания. get() возвращает копию: изменения нужно сохранить через set().
+    """
+
+    def __init__(self, ttl: float = STATE_TTL, maxsize: int = STATE_MAX_USERS):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    async def get(self, user_id: int) -> Optional[Dict]:
+        with self.lock:
+            entry = self.data.get(user_id)
+            if entry is None:
+                return None
+            state, expires_at = entry
+            if expires_at <= time.time():
+                del self.data[user_id]
+                return None
+            self.data.move_to_end(user_id)
+            return copy.deepcopy(state)
+
+    async def set(self, user_id: int, state: Dict):
+        with self.lock:
+            self.data[user_id] = (copy.deepcopy(state), time.time() + self.ttl)
+            self.data.move_to_end(user_id)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    async def delete(self, user_id: int):
+        with self.lock:
+            self.data.pop(user_id, None)
+
+    async def count(self) -> int:
+        return len(self.data)
+
+
+class SQLiteStateStore:
+    """Хранилище состояний диалогов в таблице user_states.
+
+    Состояние переживает перезапуск бота и доступно всем процессам,
+    работающим с одним файлом базы данных. Запросы выполняются через
+    AsyncDatabaseManager в пуле потоков и не блокируют event loop.
+    """
+
+    def __init__(self, db, ttl: float = STATE_TTL, purge_every: int = 1000):
+        self.db = db
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self.writes = 0
+
+    async def get(self, user_id: int) -> Optional[Dict]:
+        data = await self.db.get_user_state(user_id, time.time())
+        return json.loads(data) if data else None
+
+    async def set(self, user_id: int, state: Dict):
+        now = time.time()
+        # Время от времени удалять брошенные диалоги
+        self.writes += 1
+        purge_before = now if self.writes % self.purge_every == 0 else None
+        await self.db.set_user_state(user_id, json.dumps(state, ensure_ascii=False), now + self.ttl, purge_before)
+
+    async def delete(self, user_id: int):
+        await self.db.delete_user_state(user_id)
+
+    async def count(self) -> int:
+        return await self.db.count_user_states(time.time())
+
+
+def create_state_store(db=None, backend: str = None):
+    """Создать хранилище по настройке STATE_BACKEND: memory (по умолчанию) или sqlite.
+
+    Для sqlite нужен AsyncDatabaseManager.
+    """
+    backend = backend or os.getenv("STATE_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteStateStore(db)
+    if backend == "memory":
+        return MemoryStateStore()
+    raise ValueError(f"Неизвестное хранилище состояний: {backend}")
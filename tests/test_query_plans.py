@@ -0,0 +1,52 @@
+"""Частые запросы DatabaseManager должны идти по индексу.
+
+Запросы берутся из тех же констант и build_page_query, что и в методах
+DatabaseManager, поэтому изменение SQL в методе сразу проверяется здесь.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import HOT_QUERIES, DatabaseManager, is_slow_plan
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / "plans.db"))
+    yield manager
+    manager.close()
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_index(db, name):
+    query, params = HOT_QUERIES[name]
+    plan = db.explain_query_plan(query, params)
+    assert not is_slow_plan(plan), f"{name}: " + "; ".join(plan)
+
+
+def test_full_scan_is_detected(db):
+    plan = db.explain_query_plan("SELECT * FROM expenses WHERE description = ?", ("кофе",))
+    assert is_slow_plan(plan)
+
+
+def test_pages_in_both_directions(db):
+    trip_id = db.create_trip(1, "Россия → Турция", "Россия", "Турция", "RUB", "TRY", 0.33, 10000, 3300)
+    for amount in range(1, 8):
+        db.add_expense(trip_id, amount, amount * 3)
+
+    first = db.get_expenses_page(trip_id, limit=3)
+    assert [e['amount_to'] for e in first['items']] == [7, 6, 5]
+    assert not first['has_prev'] and first['has_next']
+
+    second = db.get_expenses_page(trip_id, limit=3, before=first['items'][-1]['expense_id'])
+    assert [e['amount_to'] for e in second['items']] == [4, 3, 2]
+    assert second['has_prev'] and second['has_next']
+
+    back = db.get_expenses_page(trip_id, limit=3, after=second['items'][0]['expense_id'])
+    assert back['items'] == first['items']
+    assert not back['has_prev'] and back['has_next']
@@ -0,0 +1,134 @@
+"""RateRefresher на поддельных часах и клиенте API курсов.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import current_api
+from current_api import AsyncCurrencyClient, RateTable, TTLCache
+from rate_refresher import RateRefresher
+
+
+class FakeClock:
+    """Заменитель time.time(): время двигает сам тест"""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeClient(AsyncCurrencyClient):
+    """AsyncCurrencyClient без сети: /live с меткой времени запроса"""
+
+    def __init__(self, clock: FakeClock):
+        super().__init__()
+        self.clock = clock
+        self.requests = []
+        self.failing = set()
+        # Метка времени котировок у поставщика; None — время запроса
+        self.quoted_at = None
+
+    async def _request(self, endpoint: str, params: dict = None) -> dict:
+        codes = params["currencies"].split(",")
+        self.requests.append(codes)
+        source = params["source"]
+        if self.failing & set(codes):
+            return {'success': False, 'error': {'info': "rate limit reached"}}
+        return {
+            'success': True,
+            'source': source,
+            'timestamp': self.quoted_at or self.clock.now,
+            'quotes': {f"{source}{code}": float(len(self.requests)) for code in codes},
+        }
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def client(monkeypatch, clock):
+    client = FakeClient(clock)
+    monkeypatch.setattr(current_api, "_async_client", client)
+    monkeypatch.setattr(current_api, "_cache", TTLCache(ttl=300))
+    return client
+
+
+def make_refresher(usage: dict, **kwargs) -> RateRefresher:
+    async def load_usage():
+        return usage
+
+    return RateRefresher(RateTable(), load_usage=load_usage, **kwargs)
+
+
+def test_scheduled_refresh_is_not_a_cycle_behind(clock, client):
+    refresher = make_refresher({"EUR": 2, "GBP": 1}, interval=900)
+
+    async def cycles():
+        for cycle in range(1, 4):
+            clock.now += refresher.interval
+            assert await refresher.refresh_once() == 1
+            assert refresher.rate_table.updated_at == clock.now
+            assert refresher.rate_table.get_rate("USD", "EUR") == cycle
+
+    asyncio.run(cycles())
+    assert len(client.requests) == 3
+
+
+def test_budget_is_spent_only_on_upstream_requests(clock, client):
+    refresher = make_refresher({"EUR": 1}, daily_quota=10)
+
+    async def refresh_with_request_in_flight():
+        # Такой же запрос уже ушёл в API: refresher дожидается его ответа
+        await asyncio.gather(
+            current_api.async_get_current_rate("USD", ["EUR"], revalidate=True),
+            refresher.refresh_once(),
+        )
+        assert refresher.budget.available() == 10
+        await refresher.refresh_once()
+
+    asyncio.run(refresh_with_request_in_flight())
+    assert len(client.requests) == 2
+    assert refresher.budget.available() == 9
+
+
+def test_failed_batch_does_not_skip_the_rest(clock, client):
+    refresher = make_refresher({"EUR": 3, "GBP": 2, "TRY": 1}, batch_size=1)
+    client.failing.add("GBP")
+
+    assert asyncio.run(refresher.refresh_once()) == 2
+    assert client.requests == [["EUR"], ["GBP"], ["TRY"]]
+    assert refresher.rate_table.has("EUR", "TRY")
+    assert not refresher.rate_table.has("GBP")
+
+
+def test_slow_provider_is_not_refreshed_on_every_request(clock, client):
+    refresher = make_refresher({"EUR": 1}, min_interval=300)
+    # Поставщик обновляет котировки реже, чем они считаются устаревшими
+    client.quoted_at = clock.now - 7200
+
+    async def trip_steps():
+        for _ in range(5):
+            clock.now += 10
+            await refresher.refresh_now(["USD", "EUR"])
+        assert refresher.rate_table.is_stale(3600, "USD", "EUR")
+        # Новой валюты в таблице нет: она загружается сразу
+        refresher.rate_table.track("GBP")
+        await refresher.refresh_now(["USD", "GBP"])
+        clock.now += 300
+        await refresher.refresh_now(["USD", "EUR"])
+
+    asyncio.run(trip_steps())
+    assert client.requests == [["EUR"], ["EUR", "GBP"], ["EUR", "GBP"]]
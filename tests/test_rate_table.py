@@ -0,0 +1,55 @@
+"""Котировки RateTable сливаются по каждой валюте отдельно.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from current_api import RateTable
+
+
+def live(timestamp: float, **quotes) -> dict:
+    """Ответ /live с котировками к USD"""
+    return {
+        'success': True,
+        'source': 'USD',
+        'timestamp': timestamp,
+        'quotes': {f"USD{code}": quote for code, quote in quotes.items()},
+    }
+
+
+def test_partial_batch_does_not_refresh_other_quotes():
+    now = time.time()
+    table = RateTable()
+    table._apply(live(now - 400, EUR=0.9, GBP=0.8))
+    table._apply(live(now, TRY=30.0))
+
+    assert table.updated_at == now - 400
+    assert table.is_stale(300, "EUR", "TRY")
+    assert not table.is_stale(300, "USD", "TRY")
+    assert table.get_rate("EUR", "TRY") == 30.0 / 0.9
+
+
+def test_older_quote_is_not_applied():
+    now = time.time()
+    table = RateTable()
+    table._apply(live(now, EUR=0.9))
+    table._apply(live(now - 60, EUR=0.5, GBP=0.8))
+
+    assert table.get_rate("USD", "EUR") == 0.9
+    assert table.get_rate("USD", "GBP") == 0.8
+    assert table.quoted_at == {"EUR": now, "GBP": now - 60}
+
+
+def test_snapshot_keeps_newer_quotes():
+    now = time.time()
+    table = RateTable()
+    table._apply(live(now, EUR=0.9))
+    table.restore({"USD": 1.0, "EUR": 0.5, "GBP": 0.8}, now - 600)
+
+    assert table.get_rate("USD", "EUR") == 0.9
+    assert table.quoted_time("GBP") == now - 600
+    assert table.updated_at == now - 600
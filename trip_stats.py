@@ -0,0 +1,42 @@
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+# Окна скользящего среднего расходов в днях
+MOVING_AVERAGE_WINDOWS = (3, 7)
+
+
+def compute_trip_stats(trip: Dict, stats: Dict, daily: Dict) -> Dict:
+    """Темп расходов и прогноз по корзинам расходов за последние дни.
+
+    Суммы — в валюте страны пребывания (spent_to, balance_to). Работа не
+    зависит от числа расходов: используются итоги путешествия и несколько корзин.
+    """
+    today = date.fromisoformat(daily['today'])
+    started = date.fromisoformat(daily['started'])
+    days_elapsed = max(1, (today - started).days + 1)
+    spent_by_day = {date.fromisoformat(day): spent_to for day, _, spent_to, _ in daily['days']}
+
+    # Скользящие средние по календарным дням (дни без расходов — нули),
+    # но не длиннее самого путешествия
+    moving_averages = {}
+    for window in MOVING_AVERAGE_WINDOWS:
+        length = min(window, days_elapsed)
+        total = sum(spent_by_day.get(today - timedelta(days=offset), 0.0) for offset in range(length))
+        moving_averages[window] = total / length
+
+    burn_rate = moving_averages[max(MOVING_AVERAGE_WINDOWS)]
+    days_left: Optional[float] = None
+    runs_out_on: Optional[date] = None
+    if burn_rate > 0 and trip['balance_to'] > 0:
+        days_left = trip['balance_to'] / burn_rate
+        runs_out_on = today + timedelta(days=int(days_left))
+
+    return {
+        'days_elapsed': days_elapsed,
+        'spent_today': spent_by_day.get(today, 0.0),
+        'average_daily': stats['total_spent_to'] / days_elapsed,
+        'moving_averages': moving_averages,
+        'burn_rate': burn_rate,
+        'days_left': days_left,
+        'runs_out_on': runs_out_on,
+    }
@@ -0,0 +1,162 @@
+"""Режим webhook: HTTP-приёмник обновлений и процессы-воркеры.
+
+Обновления раскладываются по воркерам по user_id, поэтому сообщения одного
+пользователя обрабатываются одним процессом и по порядку. HTTPS обычно
+завершается на reverse proxy, который проксирует WEBHOOK_URL на
+WEBHOOK_HOST:WEBHOOK_PORT.
+"""
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+
+from aiohttp import web
+from dotenv import load_dotenv
+from telebot.async_telebot import AsyncTeleBot
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", os.cpu_count() or 1))
+
+
+def get_update_user_id(update: dict) -> int:
+    """Найти пользователя, от которого пришло обновление (для шардирования)"""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get('from') or value.get('user')
+        if sender:
+            return sender['id']
+        chat = value.get('chat')
+        if chat:
+            return chat['id']
+    return update.get('update_id', 0)
+
+
+def worker_main(worker_id: int, updates: multiprocessing.Queue, workers: int = 1):
+    """Точка входа процесса-воркера"""
+    asyncio.run(_worker_loop(worker_id, updates, workers))
+
+
+async def _worker_loop(worker_id: int, updates: multiprocessing.Queue, workers: int):
+    # Бот импортируется только в воркере: у каждого процесса свои соединения
+    import bot
+    from telebot import types
+
+    # Курсы по расписанию загружает только воркер 0 и сохраняет их в снимок,
+    # остальные подхватывают снимок и обращаются к API лишь за новыми парами.
+    # На такие внеочередные запросы отведена четверть суточного бюджета.
+    budget = bot.rate_refresher.budget
+    follower_limit = max(1, budget.limit // (4 * workers))
+    if worker_id == 0:
+        budget.limit = max(1, budget.limit - follower_limit * (workers - 1))
+    else:
+        budget.limit = follower_limit
+        bot.rate_refresher.on_refresh = None
+    # Лимит Telegram на отправку общий для бота: каждый воркер получает свою долю.
+    # Лимит чата не делится — чат всегда обслуживает один воркер
+    bot.bot.set_global_rate(bot.bot.global_bucket.rate / workers)
+    # У каждого воркера свои метрики и свой порт /metrics: METRICS_PORT + номер воркера
+    await bot.startup(
+        metrics_port=bot.METRICS_PORT + worker_id if bot.METRICS_PORT else 0,
+        refresh_rates=worker_id == 0
+    )
+    print(f"👷 Воркер {worker_id} готов")
+
+    loop = asyncio.get_running_loop()
+    # Последняя задача каждого пользователя: следующее обновление ждёт её завершения
+    tails = {}
+    try:
+        while True:
+            item = await loop.run_in_executor(None, updates.get)
+            if item is None:
+                break
+            user_id, payload = item
+            update = types.Update.de_json(payload)
+            task = loop.create_task(_process_after(bot.bot, tails.get(user_id), update))
+            tails[user_id] = task
+            task.add_done_callback(functools.partial(_forget_task, tails, user_id))
+        if tails:
+            await asyncio.wait(list(tails.values()))
+    finally:
+        await bot.shutdown()
+
+
+async def _process_after(telegram_bot, previous, update):
+    if previous is not None:
+        await asyncio.wait([previous])
+    await telegram_bot.process_new_updates([update])
+
+
+def _forget_task(tails: dict, user_id: int, task):
+    if tails.get(user_id) is task:
+        del tails[user_id]
+
+
+async def handle_update(request: web.Request) -> web.Response:
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return web.Response(status=403)
+
+    payload = await request.text()
+    try:
+        user_id = get_update_user_id(json.loads(payload))
+    except (ValueError, AttributeError, KeyError, TypeError):
+        return web.Response(status=400)
+
+    queues = request.app['queues']
+    queues[user_id % len(queues)].put((user_id, payload))
+    return web.Response()
+
+
+async def register_webhook(app: web.Application):
+    if not WEBHOOK_URL:
+        print("⚠️ WEBHOOK_URL не задан, webhook нужно зарегистрировать вручную")
+        return
+    telegram_bot = AsyncTeleBot(BOT_TOKEN)
+    try:
+        await telegram_bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+        print(f"✅ Webhook зарегистрирован: {WEBHOOK_URL}")
+    finally:
+        await telegram_bot.close_session()
+
+
+async def stop_workers(app: web.Application):
+    for updates in app['queues']:
+        updates.put(None)
+    for worker in app['workers']:
+        worker.join(timeout=10)
+
+
+def create_app(workers: int = WEBHOOK_WORKERS) -> web.Application:
+    queues = [multiprocessing.Queue() for _ in range(workers)]
+    processes = [
+        multiprocessing.Process(target=worker_main, args=(worker_id, updates, workers), name=f"bot-worker-{worker_id}")
+        for worker_id, updates in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+
+    app = web.Application()
+    app['queues'] = queues
+    app['workers'] = processes
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    app.on_startup.append(register_webhook)
+    app.on_cleanup.append(stop_workers)
+    return app
+
+
+if __name__ == "__main__":
+    from database import DatabaseManager
+
+    print("🤖 Бот запускается в режиме webhook...")
+    # Применить миграции один раз до запуска воркеров
+    DatabaseManager().close()
+    print(f"🚀 Приём обновлений на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}, воркеров: {WEBHOOK_WORKERS}")
+    web.run_app(create_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT, print=None)